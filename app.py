@@ -1,24 +1,290 @@
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, Response, g, render_template, request, jsonify, send_file, make_response
 import pandas as pd
-from itertools import product
+import numpy as np
+import openpyxl
+from itertools import count
+import heapq
+import math
 import os
 import json
+import multiprocessing
 from io import BytesIO
 import hashlib
+import gzip
+import functools
+import mimetypes
+import pickle
+import atexit
+import threading
+import time
+import uuid
+import queue
+import contextlib
+import datetime
+try:
+    import fcntl
+except ImportError:
+    # Sin fcntl (Windows) no hay bloqueo entre procesos; basta para el servidor de desarrollo
+    fcntl = None
+import re
+import sqlite3
+import tempfile
+from collections import OrderedDict
+from operator import itemgetter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 app = Flask(__name__)
 
+# Horarios que se devuelven por nivel (válidos, con topones válidos, con conflictos) si no se pide 'limit'
+DEFAULT_SCHEDULE_LIMIT = 500
+
+# Máximo de horarios con topones inválidos que se devuelven (los de menos conflictos)
+MAX_CONFLICT_SCHEDULES = 500
+
+# Horarios por página en /api/generate y /api/generate/<id>
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 200
+
+# Resultados de /api/generate guardados para paginar: como JSON en una carpeta compartida entre
+# workers, segundos que se conservan sin usarse y máximo de entradas en memoria de cada worker
+RESULT_DIR = os.environ.get('RESULT_DIR', os.path.join(tempfile.gettempdir(), 'bachiller-horarios-results'))
+RESULT_CACHE_TTL = 600
+RESULT_CACHE_MAX_ENTRIES = 200
+RESULT_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+# Resultados de generate_schedules memorizados por (versión de datos, cursos, configs): máximo de
+# entradas, de horarios sumando todas las entradas (uno ocupa ~3 KB; una selección de 6 cursos
+# puede traer 1500) y segundos que se conserva cada entrada sin usarse
+GENERATE_CACHE_MAX_ENTRIES = 256
+GENERATE_CACHE_MAX_SCHEDULES = 20000
+GENERATE_CACHE_TTL = 1800
+
+# Desde cuántas combinaciones se usa el evaluador por lotes con NumPy (y tamaño de cada lote)
+BATCH_MIN_COMBINATIONS = 20000
+BATCH_SIZE = 8192
+
+# Desde cuántas combinaciones se reparte la generación en un pool de procesos, y cuántos procesos.
+# La selección más grande de los datos actuales (6 cursos, ~93k combinaciones) tarda ~0.2 s en el
+# evaluador por lotes, y cada reparto agrega ~0.1-0.3 s fijos (enviar los cursos y devolver hasta
+# 'limit' horarios por nivel como dicts), así que con estos datos el pool no conviene y no se usa.
+# Queda para datos más grandes (muchas más secciones por curso); ajustar con la variable de entorno.
+PARALLEL_MIN_COMBINATIONS = int(os.environ.get('PARALLEL_MIN_COMBINATIONS', 500000))
+GENERATE_PROCESSES = int(os.environ.get('GENERATE_PROCESSES', os.cpu_count() or 1))
+
+# Trabajos de generación asíncronos: carpeta compartida entre workers, segundos que se conserva
+# cada trabajo, hilos que los ejecutan y cuántos horarios parciales se muestran mientras avanzan
+JOB_DIR = os.environ.get('JOB_DIR', os.path.join(tempfile.gettempdir(), 'bachiller-horarios-jobs'))
+JOB_TTL = 1800
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+JOB_PARTIAL_RESULTS = 3
+JOB_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+# Cache de resultados generados (LRU con expiración)
+class ResultCache:
+    """
+    Guarda los horarios ya ordenados de cada /api/generate para servir las
+    páginas siguientes sin recalcular. Descarta el menos usado al superar
+    max_entries (o max_weight, sumando weigh(valor) de las entradas) y los
+    que llevan más de ttl segundos sin usarse (ttl None: sin expiración).
+    Cuenta aciertos y fallos de get().
+    """
+    
+    def __init__(self, ttl, max_entries, max_weight=None, weigh=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_weight = max_weight
+        self.weigh = weigh
+        self.hits = 0
+        self.misses = 0
+        self.weight = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def _remove(self, result_id):
+        entry = self._entries.pop(result_id, None)
+        if entry is not None and self.weigh is not None:
+            self.weight -= self.weigh(entry[1])
+        return entry
+    
+    def _evict_expired(self, now):
+        if self.ttl is None:
+            return
+        while self._entries:
+            key, (stamp, _) = next(iter(self._entries.items()))
+            if now - stamp <= self.ttl:
+                break
+            self._remove(key)
+    
+    def put(self, value, result_id=None):
+        """Guarda value bajo result_id (o un ID nuevo) y retorna el ID"""
+        if result_id is None:
+            result_id = uuid.uuid4().hex
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            self._remove(result_id)
+            self._entries[result_id] = (now, value)
+            if self.weigh is not None:
+                self.weight += self.weigh(value)
+            # La entrada recién guardada se conserva aunque sola supere max_weight
+            while len(self._entries) > 1 and (len(self._entries) > self.max_entries or
+                                              (self.max_weight is not None and self.weight > self.max_weight)):
+                self._remove(next(iter(self._entries)))
+        return result_id
+    
+    def get(self, result_id):
+        """Retorna el valor guardado (renovando su expiración) o None si no existe o expiró"""
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            entry = self._entries.pop(result_id, None)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries[result_id] = (now, entry[1])
+            return entry[1]
+    
+    def clear(self):
+        """Descarta todas las entradas"""
+        with self._lock:
+            self._entries.clear()
+            self.weight = 0
+    
+    def stats(self):
+        """Aciertos, fallos, entradas actuales y su peso total (si se usa weigh)"""
+        with self._lock:
+            stats = {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
+            if self.weigh is not None:
+                stats['weight'] = self.weight
+            return stats
+
+# Resultados guardados para paginar (los de RESULT_DIR que ya leyó este worker)
+result_cache = ResultCache(RESULT_CACHE_TTL, RESULT_CACHE_MAX_ENTRIES)
+# Peso de cada resultado de generate_schedules: (horarios, totales) -> cantidad de horarios
+generate_cache = ResultCache(GENERATE_CACHE_TTL, GENERATE_CACHE_MAX_ENTRIES, max_weight=GENERATE_CACHE_MAX_SCHEDULES,
+                             weigh=lambda result: len(result[0]))
+
+# Una versión publicada de los datos
+class Dataset:
+    """
+    DataFrame, índice de secciones y hash de una versión de los datos; no se
+    modifica después de publicarse. publish_data arma la siguiente y la
+    publica reemplazando la referencia global 'dataset' en una sola
+    asignación: cada petición toma la referencia una vez al empezar
+    (g.dataset) y termina con esa versión aunque entretanto se publique otra,
+    sin ver nunca el DataFrame de una versión con el índice de otra.
+    version sube con cada guardado, importación o edición por fila;
+    course_versions tiene la versión en que cambió cada curso por última vez
+    con ediciones por fila (los demás cursos tienen base_version, la de la
+    última carga completa).
+    """
+    __slots__ = ('df', 'section_index', 'data_hash', 'version', 'base_version', 'course_versions')
+    
+    def __init__(self, df, section_index, data_hash, version=0, base_version=0, course_versions=None):
+        self.df = df
+        self.section_index = section_index
+        self.data_hash = data_hash
+        self.version = version
+        self.base_version = base_version
+        self.course_versions = course_versions or {}
+    
+    def course_version(self, course_code):
+        return self.course_versions.get(course_code, self.base_version)
+    
+    def successor(self, df, section_index, data_hash, changed_courses=None):
+        """Siguiente versión con otros datos (changed_courses como en publish_data)"""
+        version = self.version + 1
+        if changed_courses is None:
+            return Dataset(df, section_index, data_hash, version, version, {})
+        course_versions = dict(self.course_versions)
+        for course_code in changed_courses:
+            course_versions[course_code] = version
+        return Dataset(df, section_index, data_hash, version, self.base_version, course_versions)
+
+# Almacenamiento de los datos: 'excel' (consolidado.xlsx con snapshot y diario de ediciones)
+# o 'sqlite' (tablas indexadas; el Excel solo se usa para importar y exportar)
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'excel')
+SQLITE_PATH = os.environ.get('SQLITE_PATH', os.path.join(os.path.dirname(__file__), 'consolidado.sqlite3'))
+# Ediciones que se conservan en la tabla changes para que los demás procesos se pongan al día
+SQLITE_CHANGES_KEPT = 1000
+
+# Estampa compartida de la versión de los datos: la reescribe el proceso que guarda un cambio
+# y los demás la revisan (como máximo cada DATA_STAMP_INTERVAL segundos) para recargar
+DATA_STAMP_PATH = os.path.join(os.path.dirname(__file__), 'consolidado.stamp')
+DATA_STAMP_INTERVAL = 1.0
+
+# Formato nuevo del Excel (Horarios 2026 reporte.xlsx): columna -> columna del formato antiguo
+NEW_FORMAT_COLUMNS = {
+    'CODIGO CURSO': 'asig_codigo',
+    'NOMBRE CURSO': 'asig_nombre',
+    'SECCION': 'psec_codigo',
+    'GRUPO': 'pgru_codigo',
+    'SEMESTRE': 'sare_semestre',
+    'CAMPUS': 'camp_campus',
+    'DIA': 'sdia_descripcion',
+    'HORA INICIO': 'sper_hora_ini',
+    'HORA FIN': 'sper_hora_fin'
+}
+# Columnas del formato antiguo que el formato nuevo no trae (con su valor por defecto)
+NEW_FORMAT_DEFAULTS = {
+    'sare_anho': 2026,
+    'uaca_codigo': None,
+    'uaca_nombre': None,
+    'sree_codigo': None,
+    'sree_nombre': None,
+    'sacu_codigo': None,
+    'tsal_tipo': None,
+    'ambiente_especifico': None,
+    'sare_comentario': None
+}
+# Columnas obligatorias (nombres del formato antiguo)
+REQUIRED_COLUMNS = ['asig_codigo', 'asig_nombre', 'psec_codigo', 'pgru_codigo',
+                    'sdia_descripcion', 'sper_hora_ini', 'sper_hora_fin', 'camp_campus']
+# Errores por fila que se informan al importar (el resto solo se cuenta)
+IMPORT_MAX_ERRORS = 50
+
+# Compactación del diario de ediciones: segundos sin ediciones antes de escribir consolidado.xlsx,
+# y espera máxima desde la primera edición pendiente (aunque sigan llegando ediciones)
+EXCEL_WRITE_DELAY = 2.0
+EXCEL_WRITE_MAX_DELAY = 60.0
+
+# Respuestas JSON que se comprimen con gzip (desde cuántos bytes y con qué nivel)
+COMPRESS_MIN_SIZE = 1024
+COMPRESS_LEVEL = 6
+
+# Archivos estáticos que se sirven con huella (?v=) para cache busting
+STATIC_FINGERPRINT_FILES = ('styles.css', 'app.js')
+# Una URL con huella nunca cambia de contenido: el navegador la puede guardar por un año sin revalidar
+STATIC_IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+
+# Huellas calculadas: nombre -> (mtime, hash)
+_static_fingerprints = {}
+
 # Cache busting: genera hash de archivos estáticos para forzar actualización en hotfixes
 def get_file_hash(filename):
-    """Genera hash MD5 del archivo para cache busting en producción"""
+    """
+    Hash MD5 del archivo para cache busting en producción. Se calcula una sola
+    vez; en modo debug se recalcula si cambia el mtime del archivo.
+    """
+    entry = _static_fingerprints.get(filename)
+    if entry is not None and not app.debug:
+        return entry[1]
+    
     filepath = os.path.join(app.static_folder, filename)
-    if os.path.exists(filepath):
-        try:
+    try:
+        mtime = os.path.getmtime(filepath)
+        if entry is None or entry[0] != mtime:
             with open(filepath, 'rb') as f:
-                return hashlib.md5(f.read()).hexdigest()[:8]
-        except:
-            return 'dev'
-    return 'dev'
+                entry = (mtime, hashlib.md5(f.read()).hexdigest()[:8])
+            _static_fingerprints[filename] = entry
+        return entry[1]
+    except OSError:
+        return 'dev'
+
+# Calcular las huellas al iniciar (con gunicorn, una vez antes de crear los workers)
+for _filename in STATIC_FINGERPRINT_FILES:
+    get_file_hash(_filename)
 
 @app.context_processor
 def inject_file_versions():
@@ -28,108 +294,997 @@ def inject_file_versions():
         'js_v': get_file_hash('app.js')
     }
 
+# Versión .gz de un archivo estático generada en el build, si existe y no quedó desactualizada
+def precompressed_path(filename):
+    filepath = os.path.join(app.static_folder, filename)
+    gz_path = f'{filepath}.gz'
+    try:
+        if os.path.getmtime(gz_path) >= os.path.getmtime(filepath):
+            return gz_path
+    except OSError:
+        pass
+    return None
+
+# Servir la versión .gz de los archivos con huella directamente desde disco
+@app.before_request
+def serve_precompressed_static():
+    if request.endpoint != 'static' or 'gzip' not in request.accept_encodings:
+        return None
+    
+    filename = request.view_args.get('filename')
+    if filename not in STATIC_FINGERPRINT_FILES:
+        return None
+    
+    gz_path = precompressed_path(filename)
+    if gz_path is None:
+        return None
+    
+    response = send_file(gz_path, mimetype=mimetypes.guess_type(filename)[0], conditional=True)
+    response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    return response
+
+# Cache de larga duración para las URLs de estáticos con la huella vigente
+@app.after_request
+def cache_fingerprinted_static(response):
+    if request.endpoint == 'static' and response.status_code in (200, 304):
+        filename = request.view_args.get('filename')
+        version = request.args.get('v')
+        if filename in STATIC_FINGERPRINT_FILES and version == get_file_hash(filename):
+            response.headers['Cache-Control'] = STATIC_IMMUTABLE_CACHE
+    return response
+
+# Snapshot binario de los datos ya normalizados (se regenera si cambia el Excel)
+SNAPSHOT_PATH = os.path.join(os.path.dirname(__file__), 'consolidado.snapshot.pkl')
+# Subir si cambia el formato del DataFrame normalizado o de Block
+SNAPSHOT_VERSION = 3
+
+# Hash del contenido de un archivo
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# Leer el snapshot si corresponde al Excel actual
+def load_snapshot(excel_path):
+    """
+    Retorna (df, section_index, hash de los datos, última edición del diario
+    incluida, excel_desactualizado) desde el snapshot si fue generado a partir
+    del mismo Excel (mismo mtime y tamaño, o mismo hash de contenido), o None.
+    excel_desactualizado es True si una compactación alcanzó a escribir el
+    snapshot pero no el Excel (el Excel es el anterior a esa compactación).
+    """
+    if not os.path.exists(SNAPSHOT_PATH):
+        return None
+    try:
+        with open(SNAPSHOT_PATH, 'rb') as f:
+            snapshot = pickle.load(f)
+    except Exception as e:
+        print(f"Snapshot inválido, se vuelve a leer el Excel: {str(e)}")
+        return None
+    
+    if snapshot.get('version') != SNAPSHOT_VERSION:
+        return None
+    
+    stat = os.stat(excel_path)
+    excel_outdated = False
+    if (snapshot['mtime'], snapshot['size']) != (stat.st_mtime, stat.st_size):
+        # El mtime cambia también al copiar el archivo (p. ej. al construir la imagen)
+        excel_sha256 = file_sha256(excel_path)
+        if excel_sha256 == snapshot['previous_sha256'] and excel_sha256 != snapshot['sha256']:
+            excel_outdated = True
+        elif excel_sha256 != snapshot['sha256']:
+            return None
+    
+    # Los Block del snapshot traen los ordinales de días del proceso que lo escribió: solo sirven si
+    # no chocan con los que este proceso ya asignó (días no reconocidos con otro ordinal)
+    section_index = snapshot['section_index']
+    if day_ordinals_compatible(snapshot['day_ordinals']):
+        DAY_ORDINALS.update(snapshot['day_ordinals'])
+    else:
+        print("Los ordinales de días del snapshot no calzan con los de este proceso; se recalcula el índice")
+        section_index = build_section_index(snapshot['df'])
+    
+    # Los snapshots anteriores a guardar el hash encadenado usan el del Excel
+    data_hash = snapshot.get('data_hash', snapshot['sha256'])
+    return snapshot['df'], section_index, data_hash, snapshot['journal_seq'], excel_outdated
+
+# Comparar ordinales de días con los de este proceso
+def day_ordinals_compatible(day_ordinals):
+    """True si agregar day_ordinals a DAY_ORDINALS no deja dos días con el mismo ordinal ni cambia uno ya asignado"""
+    days_by_ordinal = {ordinal: day for day, ordinal in DAY_ORDINALS.items()}
+    return all(DAY_ORDINALS.get(day, ordinal) == ordinal and days_by_ordinal.get(ordinal, day) == day
+               for day, ordinal in day_ordinals.items())
+
+# Guardar el snapshot de los datos normalizados
+def save_snapshot(excel_stat, excel_sha256, df, section_index, journal_seq, previous_sha256=None, data_hash=None):
+    """
+    Escribe el snapshot de forma atómica (archivo temporal + rename).
+    excel_stat/excel_sha256: Excel al que corresponde; journal_seq: última
+    edición del diario incluida; previous_sha256: Excel que reemplaza (al
+    compactar); data_hash: hash de los datos (por defecto el del Excel; al
+    compactar se conserva el encadenado, así todos los procesos siguen
+    reportando el mismo ETag). Retorna False si no se pudo escribir.
+    """
+    snapshot = {
+        'version': SNAPSHOT_VERSION,
+        'mtime': excel_stat.st_mtime,
+        'size': excel_stat.st_size,
+        'sha256': excel_sha256,
+        'previous_sha256': previous_sha256,
+        'data_hash': data_hash or excel_sha256,
+        'journal_seq': journal_seq,
+        'day_ordinals': dict(DAY_ORDINALS),
+        'df': df,
+        'section_index': section_index
+    }
+    tmp_path = f"{SNAPSHOT_PATH}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, SNAPSHOT_PATH)
+    except Exception as e:
+        # Sin snapshot solo se pierde el arranque rápido (también si algo no se pudo serializar)
+        print(f"No se pudo guardar el snapshot: {str(e)}")
+        return False
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return True
+
+# Escribir un DataFrame como Excel sin dejar nunca un archivo a medio escribir
+def write_excel_atomic(frame, excel_path):
+    """Escribe en un archivo temporal y lo renombra; retorna el stat y el sha256 del archivo escrito"""
+    tmp_path = f"{excel_path}.{os.getpid()}.tmp.xlsx"
+    try:
+        frame.to_excel(tmp_path, index=False, engine='openpyxl')
+        with open(tmp_path, 'rb+') as f:
+            os.fsync(f.fileno())
+        stat = os.stat(tmp_path)
+        excel_sha256 = file_sha256(tmp_path)
+        os.replace(tmp_path, excel_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return stat, excel_sha256
+
+# Diario de ediciones por fila (una línea JSON por edición, compartido por todos los procesos)
+JOURNAL_PATH = os.path.join(os.path.dirname(__file__), 'consolidado.journal.jsonl')
+
+class ChangeJournal:
+    """
+    Diario de solo agregado (JSONL) de las ediciones por fila. Cada edición se
+    escribe con fsync antes de aplicarse, así una edición confirmada sobrevive
+    a una caída aunque consolidado.xlsx todavía no se haya reescrito.
+    La primera línea {"base_seq": n} es la última edición ya incluida en el
+    snapshot; cada edición es {"seq", "op", "id", "row"} con seq creciente.
+    Los procesos (workers de gunicorn) se coordinan con locked(): con el lock
+    tomado se leen las ediciones de los demás y se agregan las propias.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.seq = 0  # Última edición aplicada por este proceso
+        self.needs_compaction = False  # Al cargar quedaron ediciones sin pasar al Excel
+        self._inode = None
+        self._offset = 0
+        self._thread_lock = threading.Lock()
+    
+    @contextlib.contextmanager
+    def locked(self):
+        """Lock exclusivo entre hilos y procesos (no reentrante)"""
+        with self._thread_lock:
+            with open(f'{self.path}.lock', 'a') as lock_file:
+                if fcntl is not None:
+                    fcntl.lockf(lock_file, fcntl.LOCK_EX)
+                yield
+    
+    def _read(self, from_start):
+        """Lee líneas completas (una última línea incompleta es una escritura interrumpida y se ignora)"""
+        try:
+            with open(self.path, 'rb') as f:
+                inode = os.fstat(f.fileno()).st_ino
+                if not from_start and inode != self._inode:
+                    return None
+                start = 0 if from_start else self._offset
+                f.seek(start)
+                data = f.read()
+        except FileNotFoundError:
+            return (None, []) if from_start else None
+        
+        end = data.rfind(b'\n') + 1
+        base_seq = None
+        entries = []
+        for line in data[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                print(f"Línea inválida en el diario, se ignora: {line[:80]!r}")
+                continue
+            if 'base_seq' in record:
+                base_seq = record['base_seq']
+            else:
+                entries.append(record)
+        
+        self._inode = inode
+        self._offset = start + end
+        return base_seq, entries
+    
+    def read_all(self):
+        """Retorna (base_seq o None si no hay diario, ediciones)"""
+        return self._read(from_start=True)
+    
+    def read_new(self):
+        """Ediciones agregadas desde la última lectura, o None si el diario fue reiniciado (hay que recargar)"""
+        result = self._read(from_start=False)
+        return None if result is None else result[1]
+    
+    def append(self, op, row_id, row):
+        """Agrega una edición con el siguiente número de secuencia y espera a que llegue al disco"""
+        line = json.dumps({'seq': self.seq + 1, 'op': op, 'id': row_id, 'row': row},
+                          ensure_ascii=False, default=str) + '\n'
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT)
+        with os.fdopen(fd, 'r+b') as f:
+            # Descartar una línea incompleta que haya quedado de una caída
+            f.truncate(self._offset)
+            f.seek(self._offset)
+            f.write(line.encode('utf-8'))
+            f.flush()
+            os.fsync(f.fileno())
+            self._offset = f.tell()
+            self._inode = os.fstat(f.fileno()).st_ino
+        self.seq += 1
+    
+    def reset(self, base_seq):
+        """Reemplaza el diario por uno vacío que continúa desde base_seq"""
+        header = (json.dumps({'base_seq': base_seq}) + '\n').encode('utf-8')
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(header)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self.seq = base_seq
+        self._inode = os.stat(self.path).st_ino
+        self._offset = len(header)
+    
+    def discard(self):
+        """Aparta el diario actual (sin borrarlo) cuando sus ediciones no se pueden aplicar"""
+        if os.path.exists(self.path):
+            discarded = f"{self.path}.discarded-{int(time.time())}"
+            os.replace(self.path, discarded)
+            print(f"Diario de ediciones apartado en {discarded}")
+
+journal = ChangeJournal(JOURNAL_PATH)
+
+# Almacenamiento en consolidado.xlsx
+class ExcelStore:
+    """
+    consolidado.xlsx con snapshot y diario de ediciones; excel_writer compacta
+    el diario en el Excel en segundo plano. Todas las operaciones (salvo
+    flush y export) requieren locked().
+    """
+    
+    def __init__(self, excel_path):
+        self.excel_path = excel_path
+    
+    def locked(self):
+        return journal.locked()
+    
+    def load(self):
+        """Retorna (df, section_index, hash de los datos)"""
+        return load_consolidado()
+    
+    def read_changes(self):
+        """Ediciones de otros procesos aún no aplicadas, o None si hay que recargar todo"""
+        entries = journal.read_new()
+        if entries is None:
+            return None
+        entries = [entry for entry in entries if entry['seq'] > journal.seq]
+        if entries:
+            journal.seq = entries[-1]['seq']
+        return entries
+    
+    def append(self, op, row_id, row, new_hash):
+        """Guarda una edición por fila (en el diario, con fsync)"""
+        journal.append(op, row_id, row)
+        excel_writer.schedule()
+    
+    def replace(self, df, section_index, source_path=None):
+        """
+        Reemplaza todos los datos por df, ya normalizado y con su índice
+        (guardado completo o importación). source_path: .xlsx del que se leyó
+        df; se mueve como nuevo consolidado.xlsx en vez de volver a escribirlo.
+        Retorna (df, section_index, hash de los datos).
+        """
+        if source_path is None:
+            stat, excel_sha256 = write_excel_atomic(df, self.excel_path)
+        else:
+            with open(source_path, 'rb+') as f:
+                os.fsync(f.fileno())
+            stat, excel_sha256 = os.stat(source_path), file_sha256(source_path)
+            os.replace(source_path, self.excel_path)
+        save_snapshot(stat, excel_sha256, df, section_index, journal.seq)
+        journal.reset(journal.seq)
+        journal.needs_compaction = False
+        return df, section_index, excel_sha256
+    
+    def flush(self):
+        """Escribe ya las ediciones pendientes; retorna False si falló"""
+        return excel_writer.flush()
+    
+    def export(self):
+        """Ruta o archivo en memoria con los datos actuales en formato Excel"""
+        # Incluir las ediciones por fila que aún no se escribieron
+        excel_writer.flush()
+        return self.excel_path
+
+# Tablas de la base SQLite: cursos, secciones/grupos (índice único por curso, sección y grupo)
+# y bloques; las columnas del Excel sin tabla propia van en blocks.extra (JSON)
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS courses (
+    asig_codigo TEXT PRIMARY KEY,
+    asig_nombre TEXT
+);
+CREATE TABLE IF NOT EXISTS sections (
+    id INTEGER PRIMARY KEY,
+    asig_codigo TEXT NOT NULL REFERENCES courses (asig_codigo),
+    psec_codigo INTEGER NOT NULL,
+    pgru_codigo INTEGER NOT NULL,
+    UNIQUE (asig_codigo, psec_codigo, pgru_codigo)
+);
+CREATE TABLE IF NOT EXISTS blocks (
+    id INTEGER PRIMARY KEY,
+    section_id INTEGER NOT NULL REFERENCES sections (id),
+    asig_nombre TEXT,
+    sdia_descripcion TEXT,
+    sper_hora_ini TEXT,
+    sper_hora_fin TEXT,
+    camp_campus TEXT,
+    extra TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS blocks_section ON blocks (section_id);
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    op TEXT NOT NULL,
+    row_id INTEGER NOT NULL,
+    row TEXT
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+SQLITE_SECTION_COLUMNS = ('asig_codigo', 'psec_codigo', 'pgru_codigo')
+SQLITE_BLOCK_COLUMNS = ('asig_nombre', 'sdia_descripcion', 'sper_hora_ini', 'sper_hora_fin', 'camp_campus')
+
+# Valor de una celda como tipo nativo de Python (para SQLite y JSON)
+def plain_value(value):
+    if isinstance(value, np.generic):
+        value = value.item()
+    if value is not None and not isinstance(value, str) and pd.isna(value):
+        return None
+    if isinstance(value, pd.Timestamp):
+        return str(value)
+    return value
+
+# Almacenamiento en SQLite
+class SqliteStore:
+    """
+    Datos en una base SQLite con cursos, secciones/grupos y bloques en tablas
+    indexadas. Cada edición por fila es una transacción; locked() abre la
+    transacción (BEGIN IMMEDIATE, exclusiva entre procesos) y la confirma al
+    salir o la deshace si hubo un error. La tabla changes guarda las últimas
+    ediciones para que los demás procesos se pongan al día sin recargar todo;
+    meta.generation cambia con cada reemplazo completo de los datos.
+    Una base vacía se llena desde consolidado.xlsx.
+    """
+    
+    def __init__(self, path, excel_path):
+        self.path = path
+        self.excel_path = excel_path
+        self.seq = 0  # Última edición aplicada por este proceso
+        self.generation = None
+        self._conn = None
+        self._pid = None
+        self._thread_lock = threading.Lock()
+    
+    def _connection(self):
+        # Una conexión por proceso: no se comparte con los workers creados con fork
+        if self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=FULL')
+            self._conn.executescript(SQLITE_SCHEMA)
+            self._pid = os.getpid()
+        return self._conn
+    
+    @contextlib.contextmanager
+    def locked(self):
+        with self._thread_lock:
+            conn = self._connection()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+    
+    def _get_meta(self, key):
+        row = self._conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return None if row is None else json.loads(row[0])
+    
+    def _set_meta(self, key, value):
+        self._conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, json.dumps(value)))
+    
+    def load(self):
+        """Retorna (df, section_index, hash de los datos)"""
+        conn = self._connection()
+        if self._get_meta('generation') is None:
+            print(f"Base de datos vacía, importando {self.excel_path}")
+            df = read_consolidado(self.excel_path)
+            return self.replace(df, build_section_index(df))
+        
+        columns = self._get_meta('columns')
+        query = (f"SELECT b.id, {', '.join('s.' + column for column in SQLITE_SECTION_COLUMNS)}, "
+                 f"{', '.join('b.' + column for column in SQLITE_BLOCK_COLUMNS)}, b.extra "
+                 "FROM blocks b JOIN sections s ON s.id = b.section_id ORDER BY b.id")
+        ids = []
+        records = []
+        for row_id, *values, extra in conn.execute(query):
+            record = dict(zip(SQLITE_SECTION_COLUMNS + SQLITE_BLOCK_COLUMNS, values))
+            record.update(json.loads(extra))
+            ids.append(row_id)
+            records.append(record)
+        df = pd.DataFrame(records, index=pd.Index(ids, dtype='int64'), columns=columns)
+        
+        self.generation = self._get_meta('generation')
+        # Último número usado (AUTOINCREMENT no lo reinicia al vaciar changes)
+        self.seq = conn.execute("SELECT COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'changes'), 0)").fetchone()[0]
+        print(f"Total registros en {os.path.basename(self.path)}: {len(df)}")
+        return df, build_section_index(df), self._get_meta('data_hash')
+    
+    def read_changes(self):
+        """Ediciones de otros procesos aún no aplicadas, o None si hay que recargar todo"""
+        conn = self._connection()
+        if self._get_meta('generation') != self.generation:
+            return None
+        rows = conn.execute('SELECT seq, op, row_id, row FROM changes WHERE seq > ? ORDER BY seq',
+                            (self.seq,)).fetchall()
+        # Ediciones ya borradas de changes que este proceso no alcanzó a aplicar
+        if rows and rows[0][0] != self.seq + 1:
+            return None
+        entries = [{'seq': seq, 'op': op, 'id': row_id, 'row': json.loads(row) if row else None}
+                   for seq, op, row_id, row in rows]
+        if entries:
+            self.seq = entries[-1]['seq']
+        return entries
+    
+    def _section_id(self, row):
+        key = tuple(plain_value(row[column]) for column in SQLITE_SECTION_COLUMNS)
+        self._conn.execute('INSERT INTO courses (asig_codigo, asig_nombre) VALUES (?, ?) '
+                           'ON CONFLICT (asig_codigo) DO UPDATE SET asig_nombre = excluded.asig_nombre',
+                           (key[0], plain_value(row.get('asig_nombre'))))
+        self._conn.execute('INSERT OR IGNORE INTO sections (asig_codigo, psec_codigo, pgru_codigo) VALUES (?, ?, ?)', key)
+        return self._conn.execute('SELECT id FROM sections WHERE asig_codigo = ? AND psec_codigo = ? '
+                                  'AND pgru_codigo = ?', key).fetchone()[0]
+    
+    def _block_values(self, row_id, section_id, row, columns):
+        extra = {column: plain_value(row.get(column)) for column in columns
+                 if column not in SQLITE_SECTION_COLUMNS and column not in SQLITE_BLOCK_COLUMNS}
+        return ((row_id, section_id) + tuple(plain_value(row.get(column)) for column in SQLITE_BLOCK_COLUMNS)
+                + (json.dumps(extra, ensure_ascii=False, default=str),))
+    
+    def _insert_blocks(self, values):
+        self._conn.executemany(f"INSERT OR REPLACE INTO blocks (id, section_id, {', '.join(SQLITE_BLOCK_COLUMNS)}, extra) "
+                               f"VALUES ({', '.join('?' * (len(SQLITE_BLOCK_COLUMNS) + 3))})", values)
+    
+    def _drop_unused(self, section_id):
+        """Quita la sección (y el curso) que quedaron sin bloques"""
+        row = self._conn.execute('SELECT asig_codigo FROM sections WHERE id = ? AND NOT EXISTS '
+                                 '(SELECT 1 FROM blocks WHERE section_id = ?)', (section_id, section_id)).fetchone()
+        if row is None:
+            return
+        self._conn.execute('DELETE FROM sections WHERE id = ?', (section_id,))
+        self._conn.execute('DELETE FROM courses WHERE asig_codigo = ? AND NOT EXISTS '
+                           '(SELECT 1 FROM sections WHERE asig_codigo = ?)', (row[0], row[0]))
+    
+    def append(self, op, row_id, row, new_hash):
+        """Guarda una edición por fila dentro de la transacción de locked()"""
+        conn = self._connection()
+        old = conn.execute('SELECT section_id FROM blocks WHERE id = ?', (row_id,)).fetchone()
+        if op == 'delete':
+            conn.execute('DELETE FROM blocks WHERE id = ?', (row_id,))
+        else:
+            self._insert_blocks([self._block_values(row_id, self._section_id(row), row, self._get_meta('columns'))])
+        if old is not None:
+            self._drop_unused(old[0])
+        
+        cursor = conn.execute('INSERT INTO changes (op, row_id, row) VALUES (?, ?, ?)',
+                              (op, row_id, None if row is None else json.dumps(row, ensure_ascii=False, default=str)))
+        self.seq = cursor.lastrowid
+        conn.execute('DELETE FROM changes WHERE seq <= ?', (self.seq - SQLITE_CHANGES_KEPT,))
+        self._set_meta('data_hash', new_hash)
+    
+    def replace(self, df, section_index, source_path=None):
+        """
+        Reemplaza todos los datos por df, ya normalizado y con su índice
+        (guardado completo, importación o base nueva). source_path no se usa:
+        el Excel importado no se guarda. Retorna (df, section_index, hash de
+        los datos).
+        """
+        conn = self._connection()
+        columns = list(df.columns)
+        
+        for table in ('blocks', 'sections', 'courses', 'changes'):
+            conn.execute(f'DELETE FROM {table}')
+        section_ids = {}
+        values = []
+        for row_id, row in zip(df.index, df.to_dict('records')):
+            key = tuple(plain_value(row[column]) for column in SQLITE_SECTION_COLUMNS)
+            if key not in section_ids:
+                section_ids[key] = self._section_id(row)
+            values.append(self._block_values(int(row_id), section_ids[key], row, columns))
+        self._insert_blocks(values)
+        
+        # Hash del contenido: igual para los mismos datos, sin importar de qué Excel vinieron
+        content_hash = hashlib.sha256(pd.util.hash_pandas_object(df.astype(str), index=True).values.tobytes()).hexdigest()
+        self.generation = uuid.uuid4().hex
+        self._set_meta('columns', columns)
+        self._set_meta('data_hash', content_hash)
+        self._set_meta('generation', self.generation)
+        self.seq = conn.execute("SELECT COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'changes'), 0)").fetchone()[0]
+        return df, section_index, content_hash
+    
+    def flush(self):
+        """Las ediciones ya quedan guardadas en cada transacción"""
+        return True
+    
+    def export(self):
+        """Ruta o archivo en memoria con los datos actuales en formato Excel"""
+        with self.locked():
+            sync_with_store()
+        buffer = BytesIO()
+        dataset.df.to_excel(buffer, index=False, engine='openpyxl')
+        buffer.seek(0)
+        return buffer
+
+# Aviso entre procesos de que los datos cambiaron
+class DataStamp:
+    """
+    Archivo que el proceso que guarda un cambio reemplaza (touch) con
+    contenido nuevo. Los demás procesos comparan inode, mtime y tamaño con
+    lo último que vieron (changed); un os.stat cada 'interval' segundos como
+    máximo, sin servicios externos.
+    """
+    
+    def __init__(self, path, interval):
+        self.path = path
+        self.interval = interval
+        self._next_check = 0.0
+        self._seen = self._state()
+    
+    def _state(self, stat=None):
+        try:
+            stat = stat or os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+    
+    def touch(self):
+        """Avisa a los demás procesos; este proceso no se avisa a sí mismo"""
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(uuid.uuid4().hex)
+            f.flush()
+            # El rename conserva inode, mtime y tamaño: el estado visto es el del temporal
+            seen = self._state(os.fstat(f.fileno()))
+        os.replace(tmp_path, self.path)
+        self._seen = seen
+    
+    def changed(self):
+        """True si otro proceso reemplazó la estampa desde la última revisión"""
+        now = time.monotonic()
+        if now < self._next_check:
+            return False
+        self._next_check = now + self.interval
+        state = self._state()
+        if state == self._seen:
+            return False
+        self._seen = state
+        return True
+
+data_stamp = DataStamp(DATA_STAMP_PATH, DATA_STAMP_INTERVAL)
+
+if STORAGE_BACKEND == 'sqlite':
+    store = SqliteStore(SQLITE_PATH, os.path.join(os.path.dirname(__file__), 'consolidado.xlsx'))
+else:
+    store = ExcelStore(os.path.join(os.path.dirname(__file__), 'consolidado.xlsx'))
+
 # Cargar datos desde consolidado.xlsx
 def load_consolidado():
-    """Carga todos los horarios desde consolidado.xlsx"""
+    """
+    Carga todos los horarios desde consolidado.xlsx.
+    Usa el snapshot binario si el Excel no cambió desde que se generó y le
+    aplica las ediciones del diario que el snapshot todavía no incluye.
+    Debe llamarse con journal.locked().
+    Retorna: (df, section_index, hash de los datos); el hash identifica los
+    datos en los ETag
+    """
     excel_path = os.path.join(os.path.dirname(__file__), 'consolidado.xlsx')
-    df = pd.read_excel(excel_path)
     
-    # Detectar formato del Excel (nuevo o antiguo)
-    if 'CODIGO CURSO' in df.columns:
-        # Nuevo formato: Horarios 2026 reporte.xlsx
-        # Columnas: CODIGO CURSO, NOMBRE CURSO, SECCION, GRUPO, SEMESTRE, CAMPUS, DIA, HORA INICIO, HORA FIN
+    base_seq, entries = journal.read_all()
+    last_seq = max([base_seq or 0] + [entry['seq'] for entry in entries])
+    
+    snapshot = load_snapshot(excel_path)
+    if snapshot is None:
+        data_hash = file_sha256(excel_path)
+        df = read_consolidado(excel_path)
         
-        # Renombrar columnas al formato esperado por el resto del código
-        df = df.rename(columns={
-            'CODIGO CURSO': 'asig_codigo',
-            'NOMBRE CURSO': 'asig_nombre',
-            'SECCION': 'psec_codigo',
-            'GRUPO': 'pgru_codigo',
-            'SEMESTRE': 'sare_semestre',
-            'CAMPUS': 'camp_campus',
-            'DIA': 'sdia_descripcion',
-            'HORA INICIO': 'sper_hora_ini',
-            'HORA FIN': 'sper_hora_fin'
-        })
+        # Índice de secciones compilado una sola vez por carga de datos
+        section_index = build_section_index(df)
         
-        # Agregar columnas faltantes con valores por defecto
-        df['sare_anho'] = 2026
-        df['uaca_codigo'] = None
-        df['uaca_nombre'] = None
-        df['sree_codigo'] = None
-        df['sree_nombre'] = None
-        df['sacu_codigo'] = None
-        df['tsal_tipo'] = None
-        df['ambiente_especifico'] = None
-        df['sare_comentario'] = None
-        
-    # Si ya está en el formato antiguo, no hacer nada
-    # Las columnas son: sare_anho, sare_semestre, uaca_codigo, uaca_nombre, sree_codigo, 
-    # sree_nombre, sacu_codigo, asig_codigo, asig_nombre, psec_codigo, pgru_codigo,
-    # sper_hora_fin, sper_hora_ini, sdia_descripcion, camp_campus, tsal_tipo, 
-    # ambiente_especifico, sare_comentario
-    
-    # Filtrar filas vacías
-    df = df.dropna(subset=['asig_codigo'])
-    
-    # Limpiar datos
-    df['asig_codigo'] = df['asig_codigo'].astype(str).str.strip()
-    df['asig_nombre'] = df['asig_nombre'].astype(str).str.strip()
-    df['psec_codigo'] = df['psec_codigo'].fillna(1).astype(int)
-    df['pgru_codigo'] = df['pgru_codigo'].fillna(1).astype(int)
-    df['sdia_descripcion'] = df['sdia_descripcion'].astype(str).str.strip()
-    df['camp_campus'] = df['camp_campus'].astype(str).str.strip().str.upper()
-    
-    # Normalizar días de la semana (capitalizar primera letra, resto minúscula)
-    def normalize_day(day):
-        if pd.isna(day):
-            return 'Lunes'
-        day = str(day).strip().lower()
-        day_mapping = {
-            'lunes': 'Lunes',
-            'martes': 'Martes',
-            'miercoles': 'Miercoles',
-            'miércoles': 'Miercoles',
-            'jueves': 'Jueves',
-            'viernes': 'Viernes',
-            'sabado': 'Sabado',
-            'sábado': 'Sabado',
-            'domingo': 'Domingo'
-        }
-        return day_mapping.get(day, day.capitalize())
+        # Los IDs de fila del diario son los del snapshot: sin él no se pueden aplicar
+        if entries:
+            print("El Excel cambió fuera de la aplicación; se descartan las ediciones del diario")
+            journal.discard()
+        save_snapshot(os.stat(excel_path), data_hash, df, section_index, last_seq)
+        journal.reset(last_seq)
+        journal.needs_compaction = False
+        return df, section_index, data_hash
     
-    df['sdia_descripcion'] = df['sdia_descripcion'].apply(normalize_day)
+    df, section_index, data_hash, snapshot_seq, excel_outdated = snapshot
+    print(f"Total registros en consolidado (snapshot): {len(df)}")
     
-    # Convertir horas a formato string HH:MM si vienen como datetime
-    def format_time(time_val):
-        if pd.isna(time_val):
-            return '00:00'
-        if isinstance(time_val, pd.Timestamp):
-            return time_val.strftime('%H:%M')
-        time_str = str(time_val).strip()
-        if len(time_str) == 8 and time_str.count(':') == 2:  # HH:MM:SS
-            return time_str[:5]  # Tomar solo HH:MM
-        return time_str
+    pending = [entry for entry in entries if entry['seq'] > snapshot_seq]
+    if pending:
+        df, section_index, data_hash, _ = apply_journal_entries(df, section_index, data_hash, pending)
+        print(f"Ediciones aplicadas desde el diario: {len(pending)}")
     
-    df['sper_hora_ini'] = df['sper_hora_ini'].apply(format_time)
-    df['sper_hora_fin'] = df['sper_hora_fin'].apply(format_time)
+    if base_seq is None:
+        journal.reset(max(snapshot_seq, last_seq))
+    journal.seq = max(snapshot_seq, last_seq)
+    # El compactador debe pasar al Excel lo que solo está en el diario o en el snapshot
+    journal.needs_compaction = bool(pending) or excel_outdated
+    return df, section_index, data_hash
+
+# Leer y normalizar el Excel
+def read_consolidado(excel_path):
+    """
+    Lee el Excel (formato nuevo o antiguo) y retorna el DataFrame normalizado.
+    Las filas con errores se omiten (y se informan en el log).
+    """
+    df, errors, _ = normalize_rows(*read_excel_rows(excel_path))
+    if errors:
+        print(f"{len(errors)} filas con errores en {os.path.basename(excel_path)} (omitidas), p. ej.: "
+              + '; '.join(f'fila {line}: {message}' for line, message in errors[:5]))
     
     print(f"Total registros en consolidado: {len(df)}")
     print(f"Cursos únicos: {df['asig_codigo'].nunique()}")
     
     return df
 
+# Leer las filas de un Excel sin cargar la hoja completa en memoria
+def read_excel_rows(excel_path):
+    """
+    Retorna (columnas, filas): columnas con los nombres del formato antiguo y
+    un iterador de (número de fila en el Excel, valores). Los .xlsx se leen
+    con openpyxl en modo solo lectura (fila por fila); los .xls con pandas.
+    Lanza ValueError si el archivo no tiene las columnas obligatorias.
+    """
+    if os.path.splitext(excel_path)[1].lower() == '.xls':
+        frame = pd.read_excel(excel_path)
+        header = list(frame.columns)
+        rows = frame.itertuples(index=False, name=None)
+        workbook = None
+    else:
+        workbook = openpyxl.load_workbook(excel_path, read_only=True, data_only=True)
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, ())
+    header = [None if name is None else str(name).strip() for name in header]
+    
+    # Detectar formato del Excel (nuevo o antiguo)
+    if 'CODIGO CURSO' in header:
+        # Nuevo formato: Horarios 2026 reporte.xlsx
+        # Columnas: CODIGO CURSO, NOMBRE CURSO, SECCION, GRUPO, SEMESTRE, CAMPUS, DIA, HORA INICIO, HORA FIN
+        header = [NEW_FORMAT_COLUMNS.get(name, name) for name in header]
+        defaults = {column: value for column, value in NEW_FORMAT_DEFAULTS.items() if column not in header}
+        names = {column: name for name, column in NEW_FORMAT_COLUMNS.items()}
+    elif 'asig_codigo' in header:
+        defaults = {}
+        names = {}
+    else:
+        if workbook is not None:
+            workbook.close()
+        raise ValueError('El archivo no tiene el formato correcto. Debe tener columnas: CODIGO CURSO, NOMBRE CURSO, SECCION, GRUPO, DIA, HORA INICIO, HORA FIN, CAMPUS (nuevo formato) o asig_codigo, asig_nombre, psec_codigo, pgru_codigo, sdia_descripcion, sper_hora_ini, sper_hora_fin, camp_campus (formato antiguo)')
+    
+    missing = [names.get(column, column) for column in REQUIRED_COLUMNS if column not in header]
+    if missing:
+        if workbook is not None:
+            workbook.close()
+        raise ValueError(f'Faltan columnas requeridas: {", ".join(missing)}')
+    
+    # Columnas sin encabezado se ignoran
+    positions = [(position, name) for position, name in enumerate(header) if name]
+    columns = [name for _, name in positions] + list(defaults)
+    
+    def iter_rows():
+        try:
+            for line, values in enumerate(rows, start=2):
+                row = {name: values[position] if position < len(values) else None for position, name in positions}
+                row.update(defaults)
+                yield line, row
+        finally:
+            if workbook is not None:
+                workbook.close()
+    
+    return columns, iter_rows()
+
+# Celda vacía (None, texto en blanco o NaN de pandas)
+def is_blank(value):
+    return value is None or (isinstance(value, str) and not value.strip()) or (isinstance(value, float) and math.isnan(value))
+
+# Validar y normalizar filas
+def normalize_rows(columns, rows):
+    """
+    Valida cada fila una sola vez (normalize_row) y arma el DataFrame por
+    columnas; días y horas se normalizan después por columna, una vez por
+    valor distinto (map_unique). Las filas sin código de curso se omiten,
+    como en las versiones anteriores.
+    Retorna (df, errores [(número de fila, mensaje)], filas omitidas)
+    """
+    data = {column: [] for column in columns}
+    errors = []
+    skipped = 0
+    for line, values in rows:
+        if is_blank(values.get('asig_codigo')):
+            skipped += not all(is_blank(value) for value in values.values())
+            continue
+        row, error = normalize_row(values, columns, format_values=False)
+        if error:
+            errors.append((line, error))
+            continue
+        for column in columns:
+            data[column].append(row[column])
+    
+    df = pd.DataFrame(data, columns=columns)
+    df['sdia_descripcion'] = map_unique(df['sdia_descripcion'], normalize_day)
+    df['sper_hora_ini'] = map_unique(df['sper_hora_ini'], format_time)
+    df['sper_hora_fin'] = map_unique(df['sper_hora_fin'], format_time)
+    return df, errors, skipped
+
+# Normalizar días de la semana (capitalizar primera letra, resto minúscula)
+def normalize_day(day):
+    if pd.isna(day):
+        return 'Lunes'
+    day = str(day).strip().lower()
+    day_mapping = {
+        'lunes': 'Lunes',
+        'martes': 'Martes',
+        'miercoles': 'Miercoles',
+        'miércoles': 'Miercoles',
+        'jueves': 'Jueves',
+        'viernes': 'Viernes',
+        'sabado': 'Sabado',
+        'sábado': 'Sabado',
+        'domingo': 'Domingo'
+    }
+    return day_mapping.get(day, day.capitalize())
+
+# Convertir horas a formato string HH:MM si vienen como datetime
+def format_time(time_val):
+    if pd.isna(time_val):
+        return '00:00'
+    if isinstance(time_val, (datetime.datetime, datetime.time)):
+        return time_val.strftime('%H:%M')
+    time_str = str(time_val).strip()
+    if len(time_str) == 8 and time_str.count(':') == 2:  # HH:MM:SS
+        return time_str[:5]  # Tomar solo HH:MM
+    return time_str
+
+# Aplicar una función por valor distinto de una columna
+def map_unique(series, func):
+    """
+    Equivalente a series.apply(func), pero llama a func una sola vez por valor
+    distinto (factorize) y expande el resultado con indexación NumPy. Días, horas
+    y campus tienen pocos valores distintos aunque el Excel tenga 100k+ filas.
+    """
+    codes, uniques = pd.factorize(series)
+    # El código -1 (valores nulos) toma el último elemento: func(None)
+    table = np.empty(len(uniques) + 1, dtype=object)
+    table[:-1] = [func(value) for value in uniques]
+    if (codes == -1).any():
+        table[-1] = func(None)
+    return pd.Series(table[codes], index=series.index)
+
+# Construir índice curso -> sección -> grupo -> bloques
+def build_section_index(df):
+    """
+    Recorre el DataFrame una sola vez y construye el índice de secciones.
+    Formato: {'CES1159': {1: {0: (Block, ...), 1: (...)}, 2: {...}}}
+    Las secciones y grupos quedan ordenados y los bloques se guardan como tuplas
+    de Block (no deben modificarse, se comparten entre todas las peticiones).
+    """
+    index = {}
+    columns = ['asig_codigo', 'asig_nombre', 'psec_codigo', 'pgru_codigo',
+               'sdia_descripcion', 'sper_hora_ini', 'sper_hora_fin', 'camp_campus']
+    
+    # Columnas derivadas (ordinal del día, minutos y clase de campus) calculadas por valor distinto
+    derived = pd.DataFrame({
+        'day': map_unique(df['sdia_descripcion'].astype(str), day_ordinal),
+        'start': map_unique(df['sper_hora_ini'].astype(str), time_to_minutes),
+        'end': map_unique(df['sper_hora_fin'].astype(str), time_to_minutes),
+        'campus_class': map_unique(df['camp_campus'].astype(str), normalize_campus)
+    }, index=df.index)
+    rows = zip(df[columns].itertuples(index=False), derived.itertuples(index=False))
+    
+    for (course_code, nombre, section, group, dia, hora_ini, hora_fin, campus), derived_row in rows:
+        course_code = str(course_code)
+        section = int(section)
+        group = int(group)
+        groups = index.setdefault(course_code, {}).setdefault(section, {})
+        groups.setdefault(group, []).append(Block(
+            course_code, str(nombre), section, group,
+            str(dia), str(hora_ini), str(hora_fin), str(campus),
+            *derived_row
+        ))
+    
+    # Ordenar secciones/grupos y congelar las listas de bloques
+    return {
+        course_code: {
+            section: {group: tuple(groups[group]) for group in sorted(groups)}
+            for section, groups in sorted(sections.items())
+        }
+        for course_code, sections in index.items()
+    }
+
+# Normalizar una fila editada
+def normalize_row(values, columns, format_values=True):
+    """
+    Normaliza los valores de una fila (textos sin espacios, sección/grupo
+    enteros, día y horas con el formato común). Se usa al leer el Excel y en
+    las ediciones por fila. format_values=False deja día y horas sin
+    formatear (normalize_rows los formatea por columna).
+    Retorna (fila con todas las columnas, None) o (None, mensaje_de_error).
+    """
+    unknown = values.keys() - set(columns) - {'_id'}
+    if unknown:
+        return None, f'Columnas desconocidas: {", ".join(column for column in values if column in unknown)}'
+    
+    row = {}
+    for column in columns:
+        value = values.get(column)
+        # Celdas vacías (o NaN de pandas) quedan como None
+        if isinstance(value, str):
+            value = value.strip() or None
+        elif value is not None and not isinstance(value, int):
+            if isinstance(value, np.generic):
+                value = value.item()
+            if isinstance(value, str):
+                value = value.strip() or None
+            elif pd.isna(value):
+                value = None
+        row[column] = value
+    
+    if row['asig_codigo'] is None:
+        return None, 'El código de curso es obligatorio'
+    
+    try:
+        row['psec_codigo'] = 1 if row['psec_codigo'] is None else int(float(row['psec_codigo']))
+        row['pgru_codigo'] = 1 if row['pgru_codigo'] is None else int(float(row['pgru_codigo']))
+        for column in ('sare_anho', 'sare_semestre'):
+            if row.get(column) is not None:
+                row[column] = int(float(row[column]))
+    except (TypeError, ValueError):
+        return None, 'Sección, grupo, año y semestre deben ser números'
+    
+    row['asig_codigo'] = str(row['asig_codigo'])
+    row['asig_nombre'] = str(row['asig_nombre'] or '')
+    if format_values:
+        row['sdia_descripcion'] = normalize_day(row['sdia_descripcion'])
+        row['sper_hora_ini'] = format_time(row['sper_hora_ini'])
+        row['sper_hora_fin'] = format_time(row['sper_hora_fin'])
+    row['camp_campus'] = str(row['camp_campus'] or '').upper()
+    return row, None
+
+# DataFrame de una fila con los tipos de las columnas de df
+def row_frame(df, row_id, row):
+    """Las columnas cuyo valor no calza con el tipo de df quedan como object"""
+    frame = pd.DataFrame([row], index=[row_id], columns=df.columns)
+    for column in df.columns:
+        try:
+            frame[column] = frame[column].astype(df[column].dtype)
+        except (TypeError, ValueError):
+            frame[column] = frame[column].astype(object)
+    return frame
+
+# Reconstruir del índice solo los cursos afectados por una edición
+def update_section_index(section_index, df, course_codes):
+    """Retorna una copia de section_index con course_codes reconstruidos desde df (o quitados si ya no tienen filas)"""
+    updated = {code: sections for code, sections in section_index.items() if code not in course_codes}
+    updated.update(build_section_index(df[df['asig_codigo'].isin(course_codes)]))
+    return updated
+
+# Aplicar una edición ya normalizada
+def edit_frame(df, op, row_id, row):
+    """op: 'insert', 'update' o 'delete'. Retorna un DataFrame nuevo (df no se modifica)"""
+    if op == 'delete':
+        return df.drop(index=row_id)
+    
+    frame = row_frame(df, row_id, row)
+    if op == 'insert':
+        return pd.concat([df, frame])
+    
+    new_df = df.copy()
+    for column in new_df.columns:
+        if frame[column].dtype != new_df[column].dtype:
+            new_df[column] = new_df[column].astype(object)
+    new_df.loc[[row_id]] = frame
+    return new_df
+
+# Hash de los datos después de una edición (encadenado: igual en todos los procesos que la aplican)
+def chain_data_hash(data_hash, op, row_id, row):
+    change = json.dumps([op, row_id, row], sort_keys=True, default=str)
+    return hashlib.sha256(f'{data_hash}:{change}'.encode('utf-8')).hexdigest()
+
+# Aplicar ediciones leídas del diario
+def apply_journal_entries(df, section_index, data_hash, entries):
+    """Retorna (df, section_index, data_hash, cursos afectados)"""
+    affected = set()
+    for entry in entries:
+        op, row_id, row = entry['op'], entry['id'], entry['row']
+        if op != 'insert':
+            if row_id not in df.index:
+                print(f"Edición {entry['seq']} del diario sobre una fila inexistente, se ignora")
+                continue
+            affected.add(str(df.at[row_id, 'asig_codigo']))
+        if row is not None:
+            affected.add(row['asig_codigo'])
+        df = edit_frame(df, op, row_id, row)
+        data_hash = chain_data_hash(data_hash, op, row_id, row)
+    
+    if affected:
+        section_index = update_section_index(section_index, df, affected)
+    return df, section_index, data_hash, affected
+
+# Clases de campus (enteros para comparar rápido en los chequeos de traslado)
+CAMPUS_OTRO = 0
+CAMPUS_ALEMANIA = 1
+CAMPUS_SAN_JUAN_PABLO = 2
+CAMPUS_VIRTUAL = 3
+
 # Normalizar campus
 def normalize_campus(campus):
     campus = str(campus).upper()
     if 'ALEMANIA' in campus or 'RIVAS' in campus:
-        return 'ALEMANIA'
+        return CAMPUS_ALEMANIA
     elif 'SAN JUAN PABLO' in campus or 'JUAN PABLO' in campus or 'SJPII' in campus or 'CJP' in campus:
-        return 'SAN_JUAN_PABLO'
+        return CAMPUS_SAN_JUAN_PABLO
     elif 'VIRTUAL' in campus or 'ONLINE' in campus:
-        return 'VIRTUAL'
+        return CAMPUS_VIRTUAL
     else:
-        return 'OTRO'
+        return CAMPUS_OTRO
+
+# Ordinal de cada día (los días no reconocidos reciben un ordinal nuevo al cargarse)
+DAY_ORDINALS = {
+    'LUNES': 0,
+    'MARTES': 1,
+    'MIERCOLES': 2,
+    'JUEVES': 3,
+    'VIERNES': 4,
+    'SABADO': 5,
+    'DOMINGO': 6
+}
+
+def day_ordinal(day):
+    """Retorna el ordinal del día (comparación sin distinguir mayúsculas)"""
+    day = str(day).strip().upper()
+    return DAY_ORDINALS.setdefault(day, len(DAY_ORDINALS))
 
 # Convertir hora string a minutos desde medianoche
 def time_to_minutes(time_str):
@@ -140,22 +1295,53 @@ def time_to_minutes(time_str):
     except:
         return 0
 
+# Bloque de horario compacto
+class Block:
+    """
+    Bloque de horario de una sección/grupo.
+    Guarda los textos originales (para el JSON) y, ya convertidos a enteros,
+    el ordinal del día, los minutos de inicio/fin y la clase de campus que usan
+    los chequeos de conflictos y el score.
+    """
+    __slots__ = ('curso', 'nombre', 'seccion', 'grupo', 'dia', 'hora_ini', 'hora_fin', 'campus',
+                 'day', 'start', 'end', 'campus_class')
+    
+    def __init__(self, curso, nombre, seccion, grupo, dia, hora_ini, hora_fin, campus,
+                 day=None, start=None, end=None, campus_class=None):
+        self.curso = curso
+        self.nombre = nombre
+        self.seccion = seccion
+        self.grupo = grupo
+        self.dia = dia
+        self.hora_ini = hora_ini
+        self.hora_fin = hora_fin
+        self.campus = campus
+        # Los campos enteros pueden venir ya calculados por build_section_index
+        self.day = day_ordinal(dia) if day is None else day
+        self.start = time_to_minutes(hora_ini) if start is None else start
+        self.end = time_to_minutes(hora_fin) if end is None else end
+        self.campus_class = normalize_campus(campus) if campus_class is None else campus_class
+    
+    def to_dict(self):
+        """Formato JSON del bloque que consume el frontend"""
+        return {
+            'curso': self.curso,
+            'nombre': self.nombre,
+            'seccion': self.seccion,
+            'grupo': self.grupo,
+            'dia': self.dia,
+            'hora_ini': self.hora_ini,
+            'hora_fin': self.hora_fin,
+            'campus': self.campus
+        }
+
 # Verificar si dos bloques de tiempo se solapan
 def blocks_overlap(block1, block2):
     """Verifica si dos bloques de horario se solapan"""
-    # Normalizar días para comparación (case-insensitive)
-    day1 = str(block1['dia']).strip().upper()
-    day2 = str(block2['dia']).strip().upper()
-    
-    if day1 != day2:
+    if block1.day != block2.day:
         return False
     
-    start1 = time_to_minutes(block1['hora_ini'])
-    end1 = time_to_minutes(block1['hora_fin'])
-    start2 = time_to_minutes(block2['hora_ini'])
-    end2 = time_to_minutes(block2['hora_fin'])
-    
-    return not (end1 <= start2 or end2 <= start1)
+    return not (block1.end <= block2.start or block2.end <= block1.start)
 
 # Verificar tiempo de traslado entre campus
 def check_travel_time(block1, block2):
@@ -166,18 +1352,14 @@ def check_travel_time(block1, block2):
     - Virtual no tiene restricción
     Retorna: (es_valido, mensaje_error o None)
     """
-    # Normalizar días para comparación (case-insensitive)
-    day1 = str(block1['dia']).strip().upper()
-    day2 = str(block2['dia']).strip().upper()
-    
-    if day1 != day2:
+    if block1.day != block2.day:
         return True, None
     
-    campus1 = normalize_campus(block1['campus'])
-    campus2 = normalize_campus(block2['campus'])
+    campus1 = block1.campus_class
+    campus2 = block2.campus_class
     
     # Si alguno es virtual, no hay problema de traslado
-    if campus1 == 'VIRTUAL' or campus2 == 'VIRTUAL':
+    if campus1 == CAMPUS_VIRTUAL or campus2 == CAMPUS_VIRTUAL:
         return True, None
     
     # Si son el mismo campus, no hay problema
@@ -185,14 +1367,14 @@ def check_travel_time(block1, block2):
         return True, None
     
     # Calcular tiempos
-    end1 = time_to_minutes(block1['hora_fin'])
-    start2 = time_to_minutes(block2['hora_ini'])
-    end2 = time_to_minutes(block2['hora_fin'])
-    start1 = time_to_minutes(block1['hora_ini'])
+    end1 = block1.end
+    start2 = block2.start
+    end2 = block2.end
+    start1 = block1.start
     
     # Determinar tiempo requerido
     # Si uno de los campus es San Juan Pablo II, necesita 30 minutos
-    if campus1 == 'SAN_JUAN_PABLO' or campus2 == 'SAN_JUAN_PABLO':
+    if campus1 == CAMPUS_SAN_JUAN_PABLO or campus2 == CAMPUS_SAN_JUAN_PABLO:
         tiempo_requerido = 30
         tipo_topon = 'Topón de campus (San Juan Pablo II)'
     else:
@@ -204,78 +1386,138 @@ def check_travel_time(block1, block2):
         if (start2 - end1) >= tiempo_requerido:
             return True, None
         else:
-            return False, f"{tipo_topon}: {block1['curso']} ({block1['campus']}) y {block2['curso']} ({block2['campus']}) - necesitan {tiempo_requerido} min"
+            return False, f"{tipo_topon}: {block1.curso} ({block1.campus}) y {block2.curso} ({block2.campus}) - necesitan {tiempo_requerido} min"
     elif end2 <= start1:
         if (start1 - end2) >= tiempo_requerido:
             return True, None
         else:
-            return False, f"{tipo_topon}: {block2['curso']} ({block2['campus']}) y {block1['curso']} ({block1['campus']}) - necesitan {tiempo_requerido} min"
+            return False, f"{tipo_topon}: {block2.curso} ({block2.campus}) y {block1.curso} ({block1.campus}) - necesitan {tiempo_requerido} min"
     
     return True, None
 
+# Curso de los topones que no indican 'course'. Antes solo se podían configurar topones de
+# BACH1121 (/api/bach1121/schedules) y el frontend no enviaba el curso: los toponesConfigs guardados
+# en config.json por esas versiones, y las pestañas abiertas con el app.js anterior, lo omiten
+TOPON_DEFAULT_COURSE = 'BACH1121'
+
+# Compilar los topones válidos de una petición
+def compile_valid_topones(valid_topones):
+    """
+    Convierte el payload validTopones en un índice
+    {(curso, sección, ordinal_día, inicio_min, fin_min): tipo_topon}
+    para que is_valid_topon sea una búsqueda O(1). Si hay dos topones para el
+    mismo bloque se respeta el primero. Los días desconocidos se descartan
+    (no pueden coincidir con ningún bloque cargado).
+    """
+    topon_index = {}
+    for topon in (valid_topones or {}).values():
+        day = DAY_ORDINALS.get(str(topon.get('dia')).strip().upper())
+        if day is None:
+            continue
+        key = (
+            str(topon.get('course', TOPON_DEFAULT_COURSE)),
+            int(topon['section']),
+            day,
+            time_to_minutes(topon.get('hora_ini')),
+            time_to_minutes(topon.get('hora_fin'))
+        )
+        topon_index.setdefault(key, topon.get('tapon_type', 'completo'))
+    return topon_index
+
+# Validar el payload validTopones de una petición
+def valid_topones_error(valid_topones):
+    """Retorna None si compile_valid_topones puede indexar valid_topones, o el mensaje de error"""
+    if not isinstance(valid_topones, dict):
+        return 'validTopones debe ser un objeto'
+    for key, topon in valid_topones.items():
+        if not isinstance(topon, dict):
+            return f'El topón {key} debe ser un objeto'
+        try:
+            int(topon.get('section'))
+        except (TypeError, ValueError, OverflowError):
+            return f'El topón {key} debe tener una sección numérica'
+    return None
+
 # Verificar si un bloque coincide con un topón válido configurado
-def is_valid_topon(block1, block2, valid_topones):
+def is_valid_topon(block1, block2, topon_index):
     """
-    Verifica si el topón entre block1 y block2 está en la lista de topones válidos.
-    Un topón es válido si uno de los bloques es de BACH1121 y coincide con un topón configurado.
+    Verifica si el topón entre block1 y block2 está en los topones válidos.
+    Un topón es válido si uno de los bloques coincide (curso, sección, día y
+    horario) con un topón configurado en topon_index (compile_valid_topones).
     
-    Para topón "completo": el otro curso debe cubrir EXACTAMENTE el mismo horario de BACH1121
-    Para topón "parcial": el otro curso puede cubrir parcialmente el horario de BACH1121
+    Para topón "completo": el otro curso debe cubrir EXACTAMENTE el mismo horario del bloque configurado
+    Para topón "parcial": el otro curso puede cubrir parcialmente el horario del bloque configurado
     
     Retorna: (es_topon_valido, tipo_topon)
     """
-    if not valid_topones:
-        return False, None
-    
-    # Verificar si alguno de los bloques es BACH1121
-    bach_block = None
-    other_block = None
-    
-    if block1['curso'] == 'BACH1121':
-        bach_block = block1
-        other_block = block2
-    elif block2['curso'] == 'BACH1121':
-        bach_block = block2
-        other_block = block1
-    else:
+    if not topon_index:
         return False, None
     
-    # Buscar si este bloque de BACH1121 está en los topones válidos
-    for topon_key, topon in valid_topones.items():
-        if (int(topon['section']) == int(bach_block['seccion']) and
-            str(topon['dia']) == str(bach_block['dia']) and
-            str(topon['hora_ini']) == str(bach_block['hora_ini']) and
-            str(topon['hora_fin']) == str(bach_block['hora_fin'])):
-            
-            tapon_type = topon.get('tapon_type', 'completo')
-            
-            # Para topón completo, el otro curso debe cubrir TODO el horario de BACH1121
-            if tapon_type == 'completo':
-                bach_start = time_to_minutes(bach_block['hora_ini'])
-                bach_end = time_to_minutes(bach_block['hora_fin'])
-                other_start = time_to_minutes(other_block['hora_ini'])
-                other_end = time_to_minutes(other_block['hora_fin'])
-                
-                # El otro curso debe empezar igual o antes y terminar igual o después
-                if other_start <= bach_start and other_end >= bach_end:
-                    return True, 'completo'
-                else:
-                    # Es un topón parcial aunque se configuró como completo
-                    return True, 'parcial'
-            else:
-                # Para topón parcial, cualquier solapamiento es válido
-                return True, 'parcial'
+    for topon_block, other_block in ((block1, block2), (block2, block1)):
+        tapon_type = topon_index.get(
+            (topon_block.curso, topon_block.seccion, topon_block.day, topon_block.start, topon_block.end))
+        if tapon_type is None:
+            continue
+        
+        # Para topón completo, el otro curso debe cubrir TODO el horario del bloque configurado
+        if tapon_type == 'completo':
+            # El otro curso debe empezar igual o antes y terminar igual o después
+            if other_block.start <= topon_block.start and other_block.end >= topon_block.end:
+                return True, 'completo'
+            # Es un topón parcial aunque se configuró como completo
+            return True, 'parcial'
+        
+        # Para topón parcial, cualquier solapamiento es válido
+        return True, 'parcial'
     
     return False, None
 
+# Evaluar un par de bloques (solapamiento, topón válido o traslado)
+def check_block_pair(block1, block2, topon_index):
+    """
+    Evalúa un par de bloques de horario.
+    Retorna None si no hay problema, o un dict con 'type' ('overlap', 'travel_time'
+    o 'valid_topon') y el mensaje correspondiente.
+    """
+    # Verificar solapamiento
+    if blocks_overlap(block1, block2):
+        # Verificar si es un topón válido
+        is_valid, topon_type = is_valid_topon(block1, block2, topon_index)
+        if is_valid:
+            return {
+                'type': 'valid_topon',
+                'topon_type': topon_type,  # 'completo' o 'parcial'
+                'block1': block1,
+                'block2': block2,
+                'message': f"Topón válido ({topon_type}): {block1.curso} y {block2.curso} el {block1.dia}"
+            }
+        return {
+            'type': 'overlap',
+            'block1': block1,
+            'block2': block2,
+            'message': f"Topón horario: {block1.curso} y {block2.curso} el {block1.dia}"
+        }
+    
+    # Verificar tiempo de traslado entre campus
+    travel_ok, travel_msg = check_travel_time(block1, block2)
+    if not travel_ok:
+        return {
+            'type': 'travel_time',
+            'block1': block1,
+            'block2': block2,
+            'message': travel_msg
+        }
+    return None
+
 # Verificar si una combinación de secciones es válida
 def is_valid_combination(sections_blocks, valid_topones=None):
     """
     Verifica si una combinación de secciones es válida.
     sections_blocks: lista de listas de bloques (cada curso tiene sus bloques)
-    valid_topones: dict con topones válidos configurados para BACH1121
+    valid_topones: dict con topones válidos configurados (payload validTopones)
     Retorna: (es_valido, lista_de_conflictos, lista_de_topones_validos)
     """
+    topon_index = compile_valid_topones(valid_topones)
     all_blocks = []
     for blocks in sections_blocks:
         all_blocks.extend(blocks)
@@ -286,71 +1528,193 @@ def is_valid_combination(sections_blocks, valid_topones=None):
     # Verificar cada par de bloques
     for i in range(len(all_blocks)):
         for j in range(i + 1, len(all_blocks)):
-            # Verificar solapamiento
-            if blocks_overlap(all_blocks[i], all_blocks[j]):
-                # Verificar si es un topón válido
-                is_valid, topon_type = is_valid_topon(all_blocks[i], all_blocks[j], valid_topones)
-                if is_valid:
-                    valid_topones_found.append({
-                        'type': 'valid_topon',
-                        'topon_type': topon_type,  # 'completo' o 'parcial'
-                        'block1': all_blocks[i],
-                        'block2': all_blocks[j],
-                        'message': f"Topón válido ({topon_type}): {all_blocks[i]['curso']} y {all_blocks[j]['curso']} el {all_blocks[i]['dia']}"
-                    })
-                else:
-                    conflicts.append({
-                        'type': 'overlap',
-                        'block1': all_blocks[i],
-                        'block2': all_blocks[j],
-                        'message': f"Topón horario: {all_blocks[i]['curso']} y {all_blocks[j]['curso']} el {all_blocks[i]['dia']}"
-                    })
+            result = check_block_pair(all_blocks[i], all_blocks[j], topon_index)
+            if result is None:
+                continue
+            if result['type'] == 'valid_topon':
+                valid_topones_found.append(result)
             else:
-                # Verificar tiempo de traslado entre campus
-                travel_ok, travel_msg = check_travel_time(all_blocks[i], all_blocks[j])
-                if not travel_ok:
-                    conflicts.append({
-                        'type': 'travel_time',
-                        'block1': all_blocks[i],
-                        'block2': all_blocks[j],
-                        'message': travel_msg
-                    })
+                conflicts.append(result)
     
     return len(conflicts) == 0, conflicts, valid_topones_found
 
-# Calcular score de un horario (para ordenar por "mejor" horario)
-def calculate_schedule_score(sections_blocks):
+# Verificar todos los pares de bloques entre dos listas (o dentro de una misma lista)
+def check_block_lists(blocks1, blocks2=None, topon_index=None):
     """
-    Calcula un puntaje para el horario. Mayor puntaje = mejor horario.
+    Verifica los pares (bloque de blocks1, bloque de blocks2).
+    Si blocks2 es None, verifica los pares dentro de blocks1.
+    Retorna: (lista_de_conflictos, lista_de_topones_validos)
     """
-    all_blocks = []
-    for blocks in sections_blocks:
-        all_blocks.extend(blocks)
-    
-    if not all_blocks:
-        return 0
+    conflicts = []
+    valid_topones_found = []
     
-    # Contar días únicos
-    days = set(b['dia'] for b in all_blocks)
-    days_score = (7 - len(days)) * 100  # Menos días = mejor
+    for i, block1 in enumerate(blocks1):
+        others = blocks1[i + 1:] if blocks2 is None else blocks2
+        for block2 in others:
+            result = check_block_pair(block1, block2, topon_index)
+            if result is None:
+                continue
+            if result['type'] == 'valid_topon':
+                valid_topones_found.append(result)
+            else:
+                conflicts.append(result)
     
-    # Calcular tiempo muerto por día
+    return conflicts, valid_topones_found
+
+# Matriz de compatibilidad entre opciones de sección
+def build_compatibility_matrix(course_sections, topon_index):
+    """
+    Evalúa una sola vez por petición cada opción consigo misma y cada par de
+    opciones de cursos distintos, para que la búsqueda solo tenga que consultar
+    resultados ya calculados.
+    Las opciones se identifican como (índice_curso, índice_opción).
+    Formato: {((0, 2), (1, 0)): (conflictos, topones_validos), ((0, 2), (0, 2)): (...)}
+    """
+    matrix = {}
+    for depth, options in enumerate(course_sections):
+        for idx, option in enumerate(options):
+            matrix[(depth, idx), (depth, idx)] = check_block_lists(option['blocks'], topon_index=topon_index)
+            for other_depth in range(depth):
+                for other_idx, other in enumerate(course_sections[other_depth]):
+                    matrix[(other_depth, other_idx), (depth, idx)] = check_block_lists(
+                        other['blocks'], option['blocks'], topon_index)
+    return matrix
+
+# Criterios del puntaje de un horario y su peso por defecto (mayor puntaje = mejor horario).
+# Con los pesos por defecto el puntaje es el de siempre: menos días, menos tiempo muerto, más temprano
+SCORE_CRITERIA = {
+    'free_days': 100,       # +1 por cada día de la semana sin clases
+    'dead_time': 1,         # -1 por cada minuto libre entre clases seguidas del mismo día
+    'early_start': 1,       # -1 por cada 10 minutos de hora de inicio promedio de los bloques
+    'latest_end': 0,        # -1 por cada 10 minutos de hora de término promedio de los días con clases
+    'campus_changes': 0,    # -1 por cada cambio de campus entre clases seguidas del mismo día
+    'preferred_window': 0   # -1 por cada minuto de clase fuera de las ventanas preferidas
+}
+
+# Métricas de los intervalos de un día
+def day_entry(intervals):
+    """
+    intervals: tupla de (inicio, fin, clase_de_campus) ordenada por inicio.
+    Retorna (intervals, tiempo_muerto, término_más_tardío, cambios_de_campus).
+    """
     dead_time = 0
-    for day in days:
-        day_blocks = sorted([b for b in all_blocks if b['dia'] == day], 
-                          key=lambda x: time_to_minutes(x['hora_ini']))
-        for i in range(len(day_blocks) - 1):
-            end_current = time_to_minutes(day_blocks[i]['hora_fin'])
-            start_next = time_to_minutes(day_blocks[i + 1]['hora_ini'])
-            dead_time += max(0, start_next - end_current)
+    campus_changes = 0
+    latest_end = intervals[0][1]
+    for (_, end, campus), (next_start, next_end, next_campus) in zip(intervals, intervals[1:]):
+        dead_time += max(0, next_start - end)
+        campus_changes += campus != next_campus
+        latest_end = max(latest_end, next_end)
+    return intervals, dead_time, latest_end, campus_changes
+
+# Aporte precalculado de una opción de sección al puntaje
+class ScoreProfile:
+    """
+    days: {día: day_entry de los bloques de la opción en ese día}, más las
+    sumas que se acumulan directamente (bloques, minutos de inicio y minutos
+    fuera de las ventanas preferidas).
+    """
+    __slots__ = ('days', 'count', 'start_sum', 'outside')
+    
+    def __init__(self, days, count, start_sum, outside):
+        self.days = days
+        self.count = count
+        self.start_sum = start_sum
+        self.outside = outside
+
+# Puntaje configurable de un horario
+class ScoringEngine:
+    """
+    Suma ponderada de los criterios de SCORE_CRITERIA. weights reemplaza
+    algunos pesos (0 desactiva un criterio) y windows es una lista de
+    ventanas preferidas (inicio, fin) en minutos.
+    Cada opción de sección se precalcula una vez (profile) en sus intervalos
+    ordenados por día; el puntaje de una combinación se arma agregando
+    opciones a un estado (add), que mezcla solo las listas de los días que
+    la opción toca, en vez de volver a ordenar todos los bloques.
+    """
+    
+    def __init__(self, weights=None, windows=()):
+        self.weights = dict(SCORE_CRITERIA)
+        self.weights.update(weights or {})
+        self.windows = tuple(windows)
+        # La suma sigue siempre el orden de SCORE_CRITERIA (mismo resultado en la búsqueda y en los lotes)
+        self.active = [(name, weight) for name, weight in self.weights.items() if weight]
+    
+    def cache_key(self):
+        """Parte de la clave del cache de generaciones"""
+        return [self.weights, self.windows]
     
-    dead_time_score = -dead_time  # Menos tiempo muerto = mejor
+    def outside_minutes(self, start, end):
+        """Minutos del intervalo que quedan fuera de las ventanas preferidas"""
+        inside = sum(max(0, min(end, window_end) - max(start, window_start))
+                     for window_start, window_end in self.windows)
+        return max(0, end - start - inside)
     
-    # Horarios más temprano
-    avg_start = sum(time_to_minutes(b['hora_ini']) for b in all_blocks) / len(all_blocks)
-    early_score = -avg_start / 10  # Más temprano = mejor
+    def profile(self, blocks):
+        """Precalcula el aporte de los bloques de una opción de sección"""
+        by_day = {}
+        for block in blocks:
+            by_day.setdefault(block.day, []).append((block.start, block.end, block.campus_class))
+        days = {day: day_entry(tuple(sorted(intervals, key=itemgetter(0)))) for day, intervals in by_day.items()}
+        outside = sum(self.outside_minutes(block.start, block.end) for block in blocks) if self.windows else 0
+        return ScoreProfile(days, len(blocks), sum(block.start for block in blocks), outside)
+    
+    # Estado de una combinación vacía: (días, bloques, suma de inicios, minutos fuera)
+    EMPTY = ({}, 0, 0, 0)
+    
+    def add(self, state, profile):
+        """Retorna el estado con la opción agregada (state no se modifica)"""
+        days, count, start_sum, outside = state
+        days = dict(days)
+        for day, entry in profile.days.items():
+            current = days.get(day)
+            if current is None:
+                days[day] = entry
+            else:
+                # Mezcla estable: ante el mismo inicio quedan primero los bloques de los cursos anteriores
+                days[day] = day_entry(tuple(heapq.merge(current[0], entry[0], key=itemgetter(0))))
+        return days, count + profile.count, start_sum + profile.start_sum, outside + profile.outside
     
-    return days_score + dead_time_score + early_score
+    def score(self, state):
+        """Puntaje de una combinación a partir de su estado"""
+        days, count, start_sum, outside = state
+        if not count:
+            return 0
+        
+        total = 0
+        for name, weight in self.active:
+            if name == 'free_days':
+                value = 7 - len(days)
+            elif name == 'dead_time':
+                value = -sum(entry[1] for entry in days.values())
+            elif name == 'early_start':
+                value = -(start_sum / count) / 10
+            elif name == 'latest_end':
+                value = -(sum(entry[2] for entry in days.values()) / len(days)) / 10
+            elif name == 'campus_changes':
+                value = -sum(entry[3] for entry in days.values())
+            else:
+                value = -outside
+            total += weight * value
+        return total
+    
+    def score_blocks(self, sections_blocks):
+        """Puntaje de una combinación a partir de los bloques de cada opción"""
+        state = self.EMPTY
+        for blocks in sections_blocks:
+            state = self.add(state, self.profile(blocks))
+        return self.score(state)
+
+# Puntaje por defecto
+DEFAULT_SCORING = ScoringEngine()
+
+# Calcular score de un horario (para ordenar por "mejor" horario)
+def calculate_schedule_score(sections_blocks, scoring=None):
+    """
+    Calcula un puntaje para el horario. Mayor puntaje = mejor horario.
+    scoring: ScoringEngine (por defecto DEFAULT_SCORING)
+    """
+    return (scoring or DEFAULT_SCORING).score_blocks(sections_blocks)
 
 # Obtener lista de cursos únicos
 def get_unique_courses(df):
@@ -362,44 +1726,37 @@ def get_unique_courses(df):
     return courses.to_dict('records')
 
 # Obtener secciones de un curso (considerando grupo)
-def get_course_sections(df, course_code):
+def get_course_sections(section_index, course_code):
     """Retorna las secciones únicas de un curso"""
-    course_df = df[df['asig_codigo'] == course_code]
     # Usar combinación de sección y grupo como identificador único
-    sections = course_df.groupby(['psec_codigo', 'pgru_codigo']).size().reset_index()[['psec_codigo', 'pgru_codigo']]
-    return sections.to_dict('records')
+    sections = section_index.get(course_code, {})
+    return [
+        {'psec_codigo': section, 'pgru_codigo': group}
+        for section, groups in sections.items()
+        for group in groups
+    ]
 
 # Obtener bloques de una sección específica
-def get_section_blocks(df, course_code, section, group):
-    """Obtiene los bloques de horario para una sección y grupo específico"""
-    section_df = df[(df['asig_codigo'] == course_code) & 
-                    (df['psec_codigo'] == section) & 
-                    (df['pgru_codigo'] == group)]
-    blocks = []
-    for _, row in section_df.iterrows():
-        blocks.append({
-            'curso': str(course_code),
-            'nombre': str(row['asig_nombre']),
-            'seccion': int(section),
-            'grupo': int(group),
-            'dia': str(row['sdia_descripcion']),
-            'hora_ini': str(row['sper_hora_ini']),
-            'hora_fin': str(row['sper_hora_fin']),
-            'campus': str(row['camp_campus'])
-        })
-    return blocks
+def get_section_blocks(section_index, course_code, section, group):
+    """Obtiene los bloques de horario (tupla inmutable de Block) para una sección y grupo específico"""
+    return section_index.get(course_code, {}).get(int(section), {}).get(int(group), ())
 
 # Generar horarios posibles
-def generate_schedules(df, selected_courses, group_configs=None, valid_topones=None, include_conflicts=True):
+def generate_schedules(section_index, selected_courses, group_configs=None, valid_topones=None, include_conflicts=True,
+                       limit=DEFAULT_SCHEDULE_LIMIT, progress=None, scoring=None):
     """
     Genera todas las combinaciones posibles de horarios para los cursos seleccionados.
     group_configs: dict con configuraciones de grupos obligatorios por sección
                    Formato nuevo: {'CES1159_1': {course: 'CES1159', section: 1, groups: [0, 1]}}
                    Los grupos solo se mezclan dentro de la misma sección
-    valid_topones: dict con topones válidos configurados para BACH1121
+    valid_topones: dict con topones válidos configurados (payload validTopones)
+    limit: máximo de horarios que se conservan por nivel (los mejores)
+    progress: callback opcional progress(evaluadas, total, parciales) para informar el avance
+    scoring: ScoringEngine con que se ordenan los horarios (por defecto DEFAULT_SCORING)
+    Retorna: (lista_de_horarios, totales_por_nivel)
     """
     if not selected_courses:
-        return []
+        return [], empty_totals()
     
     if group_configs is None:
         group_configs = {}
@@ -411,6 +1768,28 @@ def generate_schedules(df, selected_courses, group_configs=None, valid_topones=N
     print(f"DEBUG: group_configs recibido: {group_configs}")
     print(f"DEBUG: valid_topones recibido: {valid_topones}")
     
+    course_sections = build_course_sections(section_index, selected_courses, group_configs)
+    if course_sections is None:
+        # Algunos cursos no tienen secciones válidas
+        return [], empty_totals()
+    
+    # Selecciones muy grandes: repartir las opciones del primer curso entre procesos
+    total = math.prod(len(options) for options in course_sections)
+    if total >= PARALLEL_MIN_COMBINATIONS and GENERATE_PROCESSES > 1 and len(course_sections[0]) > 1:
+        return parallel_search_schedules(section_index, selected_courses, group_configs, valid_topones,
+                                         len(course_sections[0]), total, include_conflicts=include_conflicts,
+                                         limit=limit, progress=progress, scoring=scoring)
+    
+    return rank_course_sections(course_sections, valid_topones, include_conflicts=include_conflicts, limit=limit,
+                                progress=progress, scoring=scoring)
+
+# Opciones de sección de cada curso seleccionado
+def build_course_sections(section_index, selected_courses, group_configs):
+    """
+    Arma, para cada curso seleccionado, la lista de opciones (sección y grupo,
+    o grupos combinados según group_configs) con sus bloques.
+    Retorna la lista por curso, o None si algún curso no tiene opciones.
+    """
     # Convertir formato de configuración: agrupar por curso, permitiendo múltiples configs por sección
     course_group_configs = {}
     for key, config in group_configs.items():
@@ -427,14 +1806,14 @@ def generate_schedules(df, selected_courses, group_configs=None, valid_topones=N
                 course_group_configs[course_code][int(section)] = []
             
             # Agregar esta combinación de grupos a la sección
-            course_group_configs[course_code][int(section)].append([int(g) for g in groups])
+            course_group_configs[course_code][int(section)].append([int(group) for group in groups])
     
     print(f"DEBUG: course_group_configs procesado: {course_group_configs}")
     
     # Para cada curso, obtener todas sus secciones con sus bloques
     course_sections = []
     for course_code in selected_courses:
-        sections = get_course_sections(df, course_code)
+        sections = get_course_sections(section_index, course_code)
         
         # Verificar si este curso tiene grupos obligatorios configurados
         if course_code in course_group_configs:
@@ -464,11 +1843,11 @@ def generate_schedules(df, selected_courses, group_configs=None, valid_topones=N
                     # Agregar cada configuración como una opción separada
                     for required_groups in required_groups_list:
                         # Verificar si todos los grupos requeridos están disponibles
-                        if all(g in available_groups for g in required_groups):
+                        if all(group in available_groups for group in required_groups):
                             # Combinar los bloques de todos los grupos requeridos
                             combined_blocks = []
-                            for g in required_groups:
-                                blocks = get_section_blocks(df, course_code, psec, g)
+                            for group in required_groups:
+                                blocks = get_section_blocks(section_index, course_code, psec, group)
                                 combined_blocks.extend(blocks)
                             
                             if combined_blocks:
@@ -485,7 +1864,7 @@ def generate_schedules(df, selected_courses, group_configs=None, valid_topones=N
                     print(f"DEBUG: Sección {psec_int} NO tiene config, usando grupos individuales")
                     # Esta sección no tiene config, usar grupos individuales
                     for sec in sec_list:
-                        blocks = get_section_blocks(df, course_code, psec, sec['pgru_codigo'])
+                        blocks = get_section_blocks(section_index, course_code, psec, sec['pgru_codigo'])
                         if blocks:
                             section_options.append({
                                 'course': course_code,
@@ -501,7 +1880,7 @@ def generate_schedules(df, selected_courses, group_configs=None, valid_topones=N
             # Comportamiento normal: cada grupo es una opción separada
             section_options = []
             for sec in sections:
-                blocks = get_section_blocks(df, course_code, sec['psec_codigo'], sec['pgru_codigo'])
+                blocks = get_section_blocks(section_index, course_code, sec['psec_codigo'], sec['pgru_codigo'])
                 if blocks:
                     section_options.append({
                         'course': course_code,
@@ -513,146 +1892,1272 @@ def generate_schedules(df, selected_courses, group_configs=None, valid_topones=N
             if section_options:
                 course_sections.append(section_options)
     
-    if len(course_sections) != len(selected_courses):
-        # Algunos cursos no tienen secciones válidas
-        return []
+    if len(course_sections) != len(selected_courses):
+        return None
+    return course_sections
+
+# Evaluar y ordenar las combinaciones de opciones de sección
+def rank_course_sections(course_sections, valid_topones, include_conflicts=True, limit=DEFAULT_SCHEDULE_LIMIT,
+                         progress=None, scoring=None):
+    """Retorna: (lista_de_horarios, totales_por_nivel) de todas las combinaciones de course_sections"""
+    # Cada par de opciones se evalúa una sola vez por petición
+    matrix = build_compatibility_matrix(course_sections, compile_valid_topones(valid_topones))
+    
+    # Selecciones grandes: evaluar las combinaciones por lotes con NumPy
+    if math.prod(len(options) for options in course_sections) >= BATCH_MIN_COMBINATIONS:
+        return batch_search_schedules(course_sections, matrix, include_conflicts=include_conflicts, limit=limit,
+                                      progress=progress, scoring=scoring)
+    
+    return search_schedules(course_sections, matrix, include_conflicts=include_conflicts, limit=limit,
+                            progress=progress, scoring=scoring)
+
+# Evaluar una partición (un rango de opciones del primer curso) dentro de un proceso del pool
+def search_partition(course_index, selected_courses, group_configs, valid_topones, start, stop, include_conflicts,
+                     limit, scoring):
+    """course_index: la parte del section index de los cursos seleccionados"""
+    course_sections = build_course_sections(course_index, selected_courses, group_configs)
+    course_sections[0] = course_sections[0][start:stop]
+    return rank_course_sections(course_sections, valid_topones, include_conflicts=include_conflicts, limit=limit,
+                                scoring=scoring)
+
+# Pool de procesos para las generaciones grandes (no depende de los datos: cada tarea lleva sus cursos)
+_generate_pool = None
+_generate_pool_lock = threading.Lock()
+
+def get_generate_pool():
+    """
+    Retorna el pool de procesos, creado la primera vez que se usa con
+    forkserver (spawn donde no existe): nunca con fork desde un worker con
+    varios hilos, donde el hijo puede heredar tomado el lock de stdout o de
+    pandas. Los procesos importan este módulo sin cargar los datos (ver
+    GENERATE_POOL_PROCESS); el servidor ya trae importadas las dependencias.
+    """
+    global _generate_pool
+    with _generate_pool_lock:
+        if _generate_pool is None:
+            if 'forkserver' in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context('forkserver')
+                context.set_forkserver_preload(['numpy', 'pandas', 'openpyxl', 'flask'])
+            else:
+                context = multiprocessing.get_context('spawn')
+            _generate_pool = ProcessPoolExecutor(max_workers=GENERATE_PROCESSES, mp_context=context)
+        return _generate_pool
+
+# Generación repartida en varios procesos
+def parallel_search_schedules(section_index, selected_courses, group_configs, valid_topones, first_course_options,
+                              total, include_conflicts=True, limit=DEFAULT_SCHEDULE_LIMIT, progress=None, scoring=None):
+    """
+    Reparte las opciones del primer curso en rangos contiguos, evalúa cada rango
+    en el pool de procesos y mezcla los resultados parciales. Como los rangos
+    siguen el orden de enumeración, ordenar por (score, partición, posición)
+    da el mismo orden que la búsqueda en un solo proceso. El avance se informa
+    al terminar cada partición.
+    Retorna: (lista_de_horarios, totales_por_nivel)
+    """
+    n_parts = min(GENERATE_PROCESSES, first_course_options)
+    bounds = [first_course_options * i // n_parts for i in range(n_parts + 1)]
+    
+    # Solo los cursos seleccionados viajan a los procesos
+    course_index = {course: section_index[course] for course in selected_courses if course in section_index}
+    pool = get_generate_pool()
+    futures = [
+        pool.submit(search_partition, course_index, selected_courses, group_configs, valid_topones,
+                    bounds[i], bounds[i + 1], include_conflicts, limit, scoring)
+        for i in range(n_parts)
+    ]
+    
+    totals = empty_totals()
+    valid_schedules = []
+    valid_topon_schedules = []
+    conflict_schedules = []
+    
+    def ranked(entries, tier_limit):
+        entries.sort(key=lambda entry: entry[0])
+        return [schedule for _, schedule in entries[:tier_limit]]
+    
+    def partial():
+        best = (ranked(valid_schedules, JOB_PARTIAL_RESULTS) + ranked(valid_topon_schedules, JOB_PARTIAL_RESULTS) +
+                ranked(conflict_schedules, JOB_PARTIAL_RESULTS))
+        return best[:JOB_PARTIAL_RESULTS]
+    
+    tracker = SearchProgress(progress, total)
+    
+    for part, future in enumerate(futures):
+        schedules, part_totals = future.result()
+        for tier in totals:
+            totals[tier] += part_totals[tier]
+        for pos, schedule in enumerate(schedules):
+            if schedule['has_conflicts']:
+                conflict_schedules.append(((len(schedule['conflicts']), -schedule['score'], part, pos), schedule))
+            elif schedule['has_valid_topones']:
+                valid_topon_schedules.append(((-schedule['score'], part, pos), schedule))
+            else:
+                valid_schedules.append(((-schedule['score'], part, pos), schedule))
+        
+        tracker.advance(total * (bounds[part + 1] - bounds[part]) // first_course_options, partial)
+    
+    # Combinar: primero válidos, luego con topones válidos, luego con conflictos
+    all_schedules = ranked(valid_schedules, limit)
+    all_schedules.extend(ranked(valid_topon_schedules, limit))
+    all_schedules.extend(ranked(conflict_schedules, min(limit, MAX_CONFLICT_SCHEDULES)))
+    
+    return all_schedules, totals
+
+# Totales por nivel de una búsqueda sin resultados
+def empty_totals():
+    return {'valid': 0, 'valid_topon': 0, 'conflict': 0}
+
+# Normalizar la configuración de grupos de una petición
+def normalize_group_configs(group_configs, selected_courses):
+    """
+    Deja solo las configuraciones que generate_schedules usa (de cursos
+    seleccionados, con sección y al menos 2 grupos), con tipos y orden canónicos.
+    """
+    normalized = {}
+    for key in sorted(group_configs, key=str):
+        config = group_configs[key]
+        course_code = config.get('course')
+        section = config.get('section')
+        groups = config.get('groups', [])
+        if course_code in selected_courses and section is not None and len(groups) >= 2:
+            normalized[str(key)] = {
+                'course': course_code,
+                'section': int(section),
+                'groups': [int(group) for group in groups]
+            }
+    return normalized
+
+# generate_schedules memorizado (mismos cursos y configuraciones sobre los mismos datos)
+def generate_schedules_cached(data, selected_courses, group_configs=None, valid_topones=None, include_conflicts=True,
+                              limit=DEFAULT_SCHEDULE_LIMIT, progress=None, scoring=None):
+    """
+    Versión de generate_schedules (sobre el Dataset data) con cache LRU. La clave es un hash de la
+    versión de datos de cada curso, los cursos ordenados, las configuraciones
+    normalizadas, los topones válidos, el puntaje y el límite, así que un guardado o
+    importación invalida todo lo anterior y una edición por fila solo las
+    entradas de los cursos afectados. Los cursos se generan en orden alfabético para que
+    cualquier orden de selección dé el mismo resultado.
+    Retorna: (lista_de_horarios, totales_por_nivel)
+    """
+    key, courses, group_configs, valid_topones = generate_cache_key(data, selected_courses, group_configs,
+                                                                    valid_topones, include_conflicts, limit, scoring)
+    
+    cached = generate_cache.get(key)
+    if cached is not None:
+        return cached
+    
+    result = generate_schedules(data.section_index, courses, group_configs=group_configs, valid_topones=valid_topones,
+                                include_conflicts=include_conflicts, limit=limit, progress=progress, scoring=scoring)
+    generate_cache.put(result, key)
+    return result
+
+# Clave del cache de generaciones
+def generate_cache_key(data, selected_courses, group_configs, valid_topones, include_conflicts, limit, scoring=None):
+    """Retorna (clave, cursos ordenados, configuraciones normalizadas, topones ordenados)"""
+    courses = sorted(str(c) for c in selected_courses)
+    group_configs = normalize_group_configs(group_configs or {}, courses)
+    valid_topones = dict(sorted((valid_topones or {}).items()))
+    
+    # Solo las ediciones de los cursos seleccionados invalidan la entrada
+    versions = [data.course_version(course) for course in courses]
+    scoring_key = (scoring or DEFAULT_SCORING).cache_key()
+    key_data = json.dumps([versions, courses, group_configs, valid_topones, include_conflicts, limit, scoring_key],
+                          sort_keys=True, default=str)
+    key = hashlib.sha256(key_data.encode('utf-8')).hexdigest()
+    return key, courses, group_configs, valid_topones
+
+# Generación como generador (para /api/generate/stream)
+def iter_generate_schedules(data, selected_courses, group_configs=None, valid_topones=None, include_conflicts=True,
+                            limit=DEFAULT_SCHEDULE_LIMIT, stream_limit=PAGE_SIZE, scoring=None):
+    """
+    Versión de generate_schedules_cached que va entregando lo que encuentra:
+    ('progress', (evaluadas, total)) cada ~1% del total, ('schedule', horario)
+    para los primeros stream_limit horarios sin topones inválidos en el orden
+    en que aparecen, y al
+    final ('result', (lista_de_horarios, totales_por_nivel)) ya ordenada.
+    Las selecciones chicas usan la búsqueda en profundidad, que conserva solo
+    los mejores 'limit' de cada nivel; desde BATCH_MIN_COMBINATIONS se usa
+    generate_schedules (por lotes o en varios procesos) y solo se informa el
+    avance, por lote o por partición.
+    """
+    key, courses, group_configs, valid_topones = generate_cache_key(data, selected_courses, group_configs,
+                                                                    valid_topones, include_conflicts, limit, scoring)
+    
+    cached = generate_cache.get(key)
+    if cached is not None:
+        yield 'result', cached
+        return
+    
+    course_sections = build_course_sections(data.section_index, courses, group_configs)
+    if course_sections is None:
+        # Algunos cursos no tienen secciones válidas
+        yield 'result', ([], empty_totals())
+        return
+    
+    if math.prod(len(options) for options in course_sections) >= BATCH_MIN_COMBINATIONS:
+        result = yield from iter_ranked_schedules(data, courses, group_configs, valid_topones, include_conflicts,
+                                                  limit, scoring)
+        generate_cache.put(result, key)
+        yield 'result', result
+        return
+    
+    pending = []
+    matrix = build_compatibility_matrix(course_sections, compile_valid_topones(valid_topones))
+    found = iter_search_schedules(course_sections, matrix, include_conflicts=include_conflicts, limit=limit,
+                                  progress=lambda evaluated, total, _: pending.append((evaluated, total)),
+                                  scoring=scoring)
+    streamed = 0
+    for event, value in found:
+        if pending:
+            yield 'progress', pending[-1]
+            pending.clear()
+        if event == 'found' and not value[1] and streamed < stream_limit:
+            streamed += 1
+            yield 'schedule', build_schedule(*value)
+        elif event == 'result':
+            generate_cache.put(value, key)
+            yield 'result', value
+
+# generate_schedules en un hilo, entregando su avance
+def iter_ranked_schedules(data, courses, group_configs, valid_topones, include_conflicts, limit, scoring):
+    """
+    Produce ('progress', (evaluadas, total)) mientras generate_schedules evalúa
+    las combinaciones y retorna (lista_de_horarios, totales_por_nivel).
+    """
+    events = queue.Queue()
+    
+    def progress(evaluated, total, _):
+        events.put(('progress', (evaluated, total)))
+    
+    def run():
+        try:
+            events.put(('result', generate_schedules(data.section_index, courses, group_configs=group_configs,
+                                                     valid_topones=valid_topones, include_conflicts=include_conflicts,
+                                                     limit=limit, progress=progress, scoring=scoring)))
+        except Exception as e:
+            events.put(('error', e))
+    
+    threading.Thread(target=run, daemon=True).start()
+    while True:
+        event, value = events.get()
+        if event == 'error':
+            raise value
+        if event == 'result':
+            return value
+        yield event, value
+
+# Construir el dict de un horario a partir de sus opciones de sección
+def build_schedule(combination, conflicts, valid_topones_found, score=None):
+    """Arma el horario que se envía al frontend para una combinación ya evaluada"""
+    sections_blocks = [opt['blocks'] for opt in combination]
+    if score is None:
+        score = calculate_schedule_score(sections_blocks)
+    
+    # Manejar grupo como string cuando es combinado
+    sections_info = []
+    for opt in combination:
+        if opt.get('is_combined'):
+            sections_info.append({
+                'course': str(opt['course']),
+                'section': int(opt['section']),
+                'group': str(opt['group'])  # Mantener como string "0+1"
+            })
+        else:
+            sections_info.append({
+                'course': str(opt['course']),
+                'section': int(opt['section']),
+                'group': int(opt['group'])
+            })
+    
+    return {
+        'sections': sections_info,
+        'blocks': [block.to_dict() for opt in combination for block in opt['blocks']],
+        'score': float(score),
+        'has_conflicts': len(conflicts) > 0,
+        'has_valid_topones': len(valid_topones_found) > 0,
+        'conflicts': [c['message'] for c in conflicts] if conflicts else [],
+        'conflict_types': list(set(c['type'] for c in conflicts)) if conflicts else [],
+        'valid_topones': [t['message'] for t in valid_topones_found] if valid_topones_found else [],
+        'valid_topon_types': list(set(t['topon_type'] for t in valid_topones_found)) if valid_topones_found else []
+    }
+
+# Avance de una búsqueda (para los trabajos asíncronos)
+class SearchProgress:
+    """
+    Cuenta las combinaciones evaluadas (o descartadas por poda) y llama a
+    callback(evaluadas, total, parciales) cada ~1% del total. 'parciales' es
+    una lista con los mejores horarios encontrados hasta ese momento.
+    Sin callback no hace nada.
+    """
+    
+    def __init__(self, callback, total, steps=100):
+        self.callback = callback
+        self.total = total
+        self.evaluated = 0
+        self.step = max(1, total // steps)
+        self.next_report = self.step
+    
+    def advance(self, n, partial):
+        """Suma n combinaciones; partial es una función que arma los mejores horarios actuales"""
+        self.evaluated += n
+        if self.callback is not None and self.evaluated >= self.next_report:
+            self.next_report = self.evaluated + self.step
+            self.callback(self.evaluated, self.total, partial())
+
+# Agregar a un heap acotado (la raíz es el peor elemento conservado)
+def push_bounded(heap, entry, limit):
+    """Agrega entry al heap; si ya tiene limit elementos, descarta el peor"""
+    if len(heap) < limit:
+        heapq.heappush(heap, entry)
+    else:
+        heapq.heappushpop(heap, entry)
+
+# Búsqueda en profundidad de horarios con poda temprana de conflictos
+def search_schedules(course_sections, matrix, include_conflicts=True, limit=DEFAULT_SCHEDULE_LIMIT, progress=None,
+                     scoring=None):
+    """Retorna: (lista ordenada de válidos, con topones válidos y con conflictos, totales por nivel)"""
+    for event, value in iter_search_schedules(course_sections, matrix, include_conflicts=include_conflicts,
+                                              limit=limit, progress=progress, scoring=scoring):
+        if event == 'result':
+            return value
+
+# Búsqueda en profundidad como generador
+def iter_search_schedules(course_sections, matrix, include_conflicts=True, limit=DEFAULT_SCHEDULE_LIMIT,
+                          progress=None, scoring=None):
+    """
+    Recorre las combinaciones agregando una opción de sección por curso a la vez.
+    Una rama se poda apenas aparece un topón horario o de traslado, salvo que se
+    pidan conflictos; en ese caso se podan las ramas que ya tienen más conflictos
+    que el peor horario conservado.
+    Cada nivel guarda solo sus 'limit' mejores horarios en un heap acotado
+    (los con conflictos, además, como máximo MAX_CONFLICT_SCHEDULES).
+    progress: callback opcional de avance (ver SearchProgress)
+    scoring: ScoringEngine (por defecto DEFAULT_SCORING); el estado del
+    puntaje se va armando a medida que se agregan opciones
+    Produce ('found', datos) por cada combinación completa que no fue podada,
+    en el orden en que se encuentra (datos sirve para build_schedule), y al
+    final ('result', (lista ordenada de válidos, con topones válidos y con
+    conflictos, totales por nivel)).
+    """
+    conflict_limit = min(limit, MAX_CONFLICT_SCHEDULES)
+    sizes = [len(options) for options in course_sections]
+    total = math.prod(sizes)
+    totals = empty_totals()
+    
+    # Aporte al puntaje de cada opción, calculado una sola vez
+    scoring = scoring or DEFAULT_SCORING
+    profiles = [[scoring.profile(option['blocks']) for option in options] for options in course_sections]
+    
+    # Combinaciones que quedan debajo de una opción elegida en cada profundidad (para contar las podadas)
+    below = [math.prod(sizes[depth + 1:]) for depth in range(len(sizes))]
+    tracker = SearchProgress(progress, total)
+    
+    # Entradas: (score, -orden, datos) y para conflictos (-n_conflictos, score, -orden, datos)
+    # datos = (opciones, conflictos, topones_validos, score)
+    valid_heap = []
+    valid_topon_heap = []
+    conflict_heap = []
+    order = count()
+    
+    chosen = []
+    chosen_ids = []
     
-    # Generar todas las combinaciones posibles
-    valid_schedules = []
-    conflict_schedules = []
-    valid_topon_schedules = []
+    def partial():
+        best = (heapq.nlargest(JOB_PARTIAL_RESULTS, valid_heap) + heapq.nlargest(JOB_PARTIAL_RESULTS, valid_topon_heap) +
+                heapq.nlargest(JOB_PARTIAL_RESULTS, conflict_heap))
+        return [build_schedule(*entry[-1]) for entry in best[:JOB_PARTIAL_RESULTS]]
     
-    for combination in product(*course_sections):
-        sections_blocks = [opt['blocks'] for opt in combination]
-        is_valid, conflicts, valid_topones_found = is_valid_combination(sections_blocks, valid_topones)
-        
-        # Manejar grupo como string cuando es combinado
-        sections_info = []
-        for opt in combination:
-            if opt.get('is_combined'):
-                sections_info.append({
-                    'course': str(opt['course']),
-                    'section': int(opt['section']),
-                    'group': str(opt['group'])  # Mantener como string "0+1"
-                })
+    def visit(depth, conflicts, valid_topones_found, score_state):
+        if depth == len(course_sections):
+            score = scoring.score(score_state)
+            data = (tuple(chosen), conflicts, valid_topones_found, score)
+            if conflicts:
+                push_bounded(conflict_heap, (-len(conflicts), score, -next(order), data), conflict_limit)
+            elif valid_topones_found:
+                # Horario válido pero con topones permitidos
+                totals['valid_topon'] += 1
+                push_bounded(valid_topon_heap, (score, -next(order), data), limit)
             else:
-                sections_info.append({
-                    'course': str(opt['course']),
-                    'section': int(opt['section']),
-                    'group': int(opt['group'])
-                })
+                totals['valid'] += 1
+                push_bounded(valid_heap, (score, -next(order), data), limit)
+            tracker.advance(1, partial)
+            yield 'found', data
+            return
         
-        schedule = {
-            'sections': sections_info,
-            'blocks': [block for opt in combination for block in opt['blocks']],
-            'score': float(calculate_schedule_score(sections_blocks)),
-            'has_conflicts': not is_valid,
-            'has_valid_topones': len(valid_topones_found) > 0,
-            'conflicts': [c['message'] for c in conflicts] if conflicts else [],
-            'conflict_types': list(set(c['type'] for c in conflicts)) if conflicts else [],
-            'valid_topones': [t['message'] for t in valid_topones_found] if valid_topones_found else [],
-            'valid_topon_types': list(set(t['topon_type'] for t in valid_topones_found)) if valid_topones_found else []
-        }
+        for idx, option in enumerate(course_sections[depth]):
+            option_id = (depth, idx)
+            branch_conflicts = list(conflicts)
+            branch_topones = list(valid_topones_found)
+            for other_id in chosen_ids + [option_id]:
+                pair_conflicts, pair_topones = matrix[other_id, option_id]
+                branch_conflicts.extend(pair_conflicts)
+                branch_topones.extend(pair_topones)
+            
+            if branch_conflicts:
+                if not include_conflicts or conflict_limit < 1:
+                    tracker.advance(below[depth], partial)
+                    continue
+                # Los conflictos solo aumentan al agregar cursos: podar si ya es peor que el peor conservado
+                if len(conflict_heap) >= conflict_limit and len(branch_conflicts) > -conflict_heap[0][0]:
+                    tracker.advance(below[depth], partial)
+                    continue
+            
+            chosen.append(option)
+            chosen_ids.append(option_id)
+            branch_state = scoring.add(score_state, profiles[depth][idx])
+            yield from visit(depth + 1, branch_conflicts, branch_topones, branch_state)
+            chosen_ids.pop()
+            chosen.pop()
+    
+    yield from visit(0, [], [], scoring.EMPTY)
+    
+    # Los que no son válidos fueron podados o son conflictos
+    totals['conflict'] = total - totals['valid'] - totals['valid_topon']
+    
+    # Ordenar cada nivel de mejor a peor y armar los horarios
+    def ranked(heap):
+        return [build_schedule(*entry[-1]) for entry in sorted(heap, reverse=True)]
+    
+    # Combinar: primero válidos, luego con topones válidos, luego con conflictos
+    all_schedules = ranked(valid_heap)
+    all_schedules.extend(ranked(valid_topon_heap))
+    all_schedules.extend(ranked(conflict_heap))
+    
+    yield 'result', (all_schedules, totals)
+
+# Conflictos y topones válidos de una combinación completa, desde la matriz
+def combination_checks(matrix, option_ids):
+    """Junta los resultados de la matriz en el mismo orden que usa la búsqueda en profundidad"""
+    conflicts = []
+    valid_topones_found = []
+    for pos, option_id in enumerate(option_ids):
+        for other_id in option_ids[:pos + 1]:
+            pair_conflicts, pair_topones = matrix[other_id, option_id]
+            conflicts.extend(pair_conflicts)
+            valid_topones_found.extend(pair_topones)
+    return conflicts, valid_topones_found
+
+# Día de relleno para los bloques vacíos de las matrices (queda al final al ordenar)
+PAD_DAY = 1 << 20
+
+# Codificar las opciones de un curso como arreglos de intervalos
+def encode_course_options(options, scoring=DEFAULT_SCORING):
+    """
+    Codifica las opciones de sección de un curso como arreglos NumPy de
+    (n_opciones, max_bloques) con día, inicio y fin en minutos y clase de
+    campus. Los huecos se rellenan con PAD_DAY y se marcan en 'real'. Los
+    minutos fuera de las ventanas preferidas de scoring van sumados por opción.
+    """
+    width = max(len(option['blocks']) for option in options)
+    days = np.full((len(options), width), PAD_DAY, dtype=np.int64)
+    starts = np.zeros((len(options), width), dtype=np.int64)
+    ends = np.zeros((len(options), width), dtype=np.int64)
+    campus = np.zeros((len(options), width), dtype=np.int64)
+    real = np.zeros((len(options), width), dtype=bool)
+    outside = np.zeros(len(options), dtype=np.int64)
+    for i, option in enumerate(options):
+        for j, block in enumerate(option['blocks']):
+            days[i, j] = block.day
+            starts[i, j] = block.start
+            ends[i, j] = block.end
+            campus[i, j] = block.campus_class
+            real[i, j] = True
+            if scoring.windows:
+                outside[i] += scoring.outside_minutes(block.start, block.end)
+    return {
+        'day': days,
+        'start': starts,
+        'end': ends,
+        'campus': campus,
+        'real': real,
+        'count': real.sum(axis=1),
+        'start_sum': starts.sum(axis=1),
+        'outside': outside
+    }
+
+# Calcular el score de muchas combinaciones a la vez
+def batch_schedule_scores(encoded, option_idx, scoring=DEFAULT_SCORING):
+    """
+    Versión vectorizada de ScoringEngine.score (misma suma y mismo orden de operaciones).
+    encoded: lista de codificaciones por curso (encode_course_options)
+    option_idx: tupla con un arreglo de índices de opción por curso (uno por combinación)
+    """
+    def gather(field):
+        return np.concatenate([enc[field][idx] for enc, idx in zip(encoded, option_idx)], axis=1)
+    
+    def total_of(field):
+        return sum(enc[field][idx] for enc, idx in zip(encoded, option_idx))
+    
+    days = gather('day')
+    starts = gather('start')
+    ends = gather('end')
+    n_blocks = total_of('count')
+    
+    # Ordenar cada combinación por (día, inicio); orden estable como sorted()
+    order = np.argsort(days * (1 << 16) + starts, axis=1, kind='stable')
+    sorted_days = np.take_along_axis(days, order, axis=1)
+    sorted_starts = np.take_along_axis(starts, order, axis=1)
+    sorted_ends = np.take_along_axis(ends, order, axis=1)
+    
+    same_day = sorted_days[:, 1:] == sorted_days[:, :-1]
+    
+    # Días únicos: primer bloque real de cada día
+    new_day = (~same_day) & (sorted_days[:, 1:] != PAD_DAY)
+    day_count = 1 + new_day.sum(axis=1)
+    
+    total = np.zeros(len(n_blocks))
+    for name, weight in scoring.active:
+        if name == 'free_days':
+            value = 7 - day_count
+        elif name == 'dead_time':
+            # Tiempo muerto entre bloques consecutivos del mismo día (el relleno aporta 0)
+            value = -(np.maximum(0, sorted_starts[:, 1:] - sorted_ends[:, :-1]) * same_day).sum(axis=1)
+        elif name == 'early_start':
+            value = -(total_of('start_sum') / n_blocks) / 10
+        elif name == 'latest_end':
+            # Término más tardío de cada día: último bloque de cada día al ordenar por (día, fin)
+            by_end = np.argsort(days * (1 << 16) + ends, axis=1, kind='stable')
+            end_days = np.take_along_axis(days, by_end, axis=1)
+            last_of_day = end_days != PAD_DAY
+            last_of_day[:, :-1] &= end_days[:, 1:] != end_days[:, :-1]
+            latest_end_sum = (np.take_along_axis(ends, by_end, axis=1) * last_of_day).sum(axis=1)
+            value = -(latest_end_sum / day_count) / 10
+        elif name == 'campus_changes':
+            sorted_campus = np.take_along_axis(gather('campus'), order, axis=1)
+            value = -((sorted_campus[:, 1:] != sorted_campus[:, :-1]) & same_day).sum(axis=1)
+        else:
+            value = -total_of('outside')
+        total = total + weight * value
+    return total
+
+# Evaluador por lotes de todas las combinaciones con NumPy
+def batch_search_schedules(course_sections, matrix, include_conflicts=True, limit=DEFAULT_SCHEDULE_LIMIT,
+                           progress=None, scoring=None):
+    """
+    Evalúa las combinaciones en lotes de BATCH_SIZE en vez de recorrerlas una a una.
+    Los conteos de conflictos y topones válidos salen de sumar la matriz de
+    compatibilidad y el score de batch_schedule_scores. Cada nivel conserva solo
+    sus 'limit' mejores combinaciones y solo esas se arman como dicts; el orden
+    es el mismo de search_schedules.
+    Retorna: (lista de horarios, totales por nivel)
+    """
+    sizes = [len(options) for options in course_sections]
+    total = math.prod(sizes)
+    scoring = scoring or DEFAULT_SCORING
+    encoded = [encode_course_options(options, scoring) for options in course_sections]
+    conflict_limit = min(limit, MAX_CONFLICT_SCHEDULES) if include_conflicts else 0
+    totals = empty_totals()
+    
+    # Conteos por par de opciones (la diagonal a == b son los pares dentro de la opción)
+    conflict_counts = {}
+    topon_counts = {}
+    for b in range(len(course_sections)):
+        for a in range(b + 1):
+            shape = (sizes[a], sizes[b])
+            conflicts = np.zeros(shape, dtype=np.int64)
+            topones = np.zeros(shape, dtype=np.int64)
+            for i in range(sizes[a]):
+                for j in range(sizes[b]):
+                    if a == b and i != j:
+                        continue
+                    pair_conflicts, pair_topones = matrix[(a, i), (b, j)]
+                    conflicts[i, j] = len(pair_conflicts)
+                    topones[i, j] = len(pair_topones)
+            conflict_counts[a, b] = conflicts
+            topon_counts[a, b] = topones
+    
+    # Mejores de cada nivel hasta ahora: (índices planos, scores, n_conflictos)
+    def keep_best(kept, candidates, tier_limit):
+        if kept is not None:
+            candidates = tuple(np.concatenate(pair) for pair in zip(kept, candidates))
+        # Menos conflictos, mayor score, primero encontrado
+        best = np.lexsort((candidates[0], -candidates[1], candidates[2]))[:tier_limit]
+        return tuple(values[best] for values in candidates)
+    
+    def materialize(kept, n=None):
+        schedules = []
+        if kept is None:
+            return schedules
+        for flat_idx, score in zip(kept[0][:n], kept[1][:n]):
+            option_idx = np.unravel_index(flat_idx, sizes)
+            option_ids = [(depth, int(idx)) for depth, idx in enumerate(option_idx)]
+            combination = [course_sections[depth][idx] for depth, idx in option_ids]
+            conflicts, valid_topones_found = combination_checks(matrix, option_ids)
+            schedules.append(build_schedule(combination, conflicts, valid_topones_found, score=score))
+        return schedules
+    
+    valid_kept = None
+    valid_topon_kept = None
+    conflict_kept = None
+    
+    def partial():
+        best = (materialize(valid_kept, JOB_PARTIAL_RESULTS) + materialize(valid_topon_kept, JOB_PARTIAL_RESULTS) +
+                materialize(conflict_kept, JOB_PARTIAL_RESULTS))
+        return best[:JOB_PARTIAL_RESULTS]
+    
+    tracker = SearchProgress(progress, total)
+    
+    for chunk_start in range(0, total, BATCH_SIZE):
+        flat = np.arange(chunk_start, min(total, chunk_start + BATCH_SIZE))
+        # Orden lexicográfico, igual que la búsqueda en profundidad
+        option_idx = np.unravel_index(flat, sizes)
+        
+        n_conflicts = sum(conflict_counts[a, b][option_idx[a], option_idx[b]] for a, b in conflict_counts)
+        n_topones = sum(topon_counts[a, b][option_idx[a], option_idx[b]] for a, b in topon_counts)
+        scores = batch_schedule_scores(encoded, option_idx, scoring)
         
-        if is_valid and len(valid_topones_found) > 0:
-            # Horario válido pero con topones permitidos
-            valid_topon_schedules.append(schedule)
-        elif is_valid:
-            valid_schedules.append(schedule)
-        elif include_conflicts:
-            conflict_schedules.append(schedule)
+        valid = n_conflicts == 0
+        for mask, tier in ((valid & (n_topones == 0), 'valid'), (valid & (n_topones > 0), 'valid_topon')):
+            totals[tier] += int(mask.sum())
+        valid_kept = keep_best(valid_kept, (flat[valid & (n_topones == 0)], scores[valid & (n_topones == 0)],
+                                            n_conflicts[valid & (n_topones == 0)]), limit)
+        valid_topon_kept = keep_best(valid_topon_kept, (flat[valid & (n_topones > 0)], scores[valid & (n_topones > 0)],
+                                                        n_conflicts[valid & (n_topones > 0)]), limit)
+        if conflict_limit > 0:
+            conflict_kept = keep_best(conflict_kept, (flat[~valid], scores[~valid], n_conflicts[~valid]), conflict_limit)
+        
+        tracker.advance(len(flat), partial)
     
-    # Ordenar por score
-    valid_schedules.sort(key=lambda x: x['score'], reverse=True)
-    valid_topon_schedules.sort(key=lambda x: x['score'], reverse=True)
-    conflict_schedules.sort(key=lambda x: (len(x['conflicts']), -x['score']))
+    totals['conflict'] = total - totals['valid'] - totals['valid_topon']
     
     # Combinar: primero válidos, luego con topones válidos, luego con conflictos
-    all_schedules = valid_schedules
-    all_schedules.extend(valid_topon_schedules)
-    if include_conflicts:
-        all_schedules.extend(conflict_schedules)
+    all_schedules = materialize(valid_kept)
+    all_schedules.extend(materialize(valid_topon_kept))
+    all_schedules.extend(materialize(conflict_kept))
     
-    return all_schedules
+    return all_schedules, totals
+
+# Los procesos del pool de generación (hijos de multiprocessing, o este archivo importado como
+# __mp_main__ al correrlo con python app.py) importan el módulo solo por sus funciones: cada tarea
+# trae sus cursos y no deben tocar el almacenamiento
+GENERATE_POOL_PROCESS = multiprocessing.parent_process() is not None or __name__ == '__mp_main__'
+
+# Cargar datos al iniciar (con las ediciones del diario que falten en el snapshot)
+if GENERATE_POOL_PROCESS:
+    dataset = None
+else:
+    with store.locked():
+        dataset = Dataset(*store.load())
+
+# Serializa las ediciones de datos (por fila, guardado completo e importación)
+data_lock = threading.Lock()
+
+# Publicar datos nuevos
+def publish_data(new_df, new_section_index, new_hash, changed_courses=None):
+    """
+    Publica la siguiente versión de los datos (una sola asignación de
+    'dataset') y la retorna. changed_courses: cursos afectados por una edición
+    por fila (solo se invalidan sus generaciones en cache); None invalida todo
+    (guardado completo o importación). Requiere data_lock.
+    """
+    global dataset
+    dataset = dataset.successor(new_df, new_section_index, new_hash, changed_courses)
+    if changed_courses is None:
+        # Las claves ya no coinciden; liberar la memoria de una vez
+        generate_cache.clear()
+    return dataset
+
+# Aplicar en segundo plano los cambios guardados por otros procesos
+_refresh_lock = threading.Lock()
+
+def refresh_data():
+    """Ediciones de otros procesos o recarga del snapshot; una sola a la vez por proceso"""
+    if not _refresh_lock.acquire(blocking=False):
+        return
+    try:
+        with store.locked():
+            sync_with_store()
+    except Exception as e:
+        print(f"Error recargando datos: {str(e)}")
+    finally:
+        _refresh_lock.release()
+
+# Cada petición trabaja con la versión de los datos publicada al empezar
+@app.before_request
+def pin_dataset():
+    # Si otro proceso cambió los datos, se recargan sin hacer esperar a esta petición
+    if data_stamp.changed():
+        threading.Thread(target=refresh_data, daemon=True).start()
+    g.dataset = dataset
+
+# Lista de cursos de los datos cargados (se calcula una vez por versión de datos)
+_courses_cache = (None, None)
+
+def cached_unique_courses(data):
+    global _courses_cache
+    if _courses_cache[0] != data.data_hash:
+        _courses_cache = (data.data_hash, get_unique_courses(data.df))
+    return _courses_cache[1]
+
+# ETag/GET condicional para las rutas que solo dependen de los datos cargados
+def data_etag(view):
+    """
+    Marca la respuesta con un ETag fuerte derivado del hash de los datos y
+    responde 304 sin ejecutar la vista si el cliente ya tiene esa versión
+    (If-None-Match). Acepta también la variante comprimida del ETag.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        etag = g.dataset.data_hash[:32]
+        if request.if_none_match.contains(etag) or request.if_none_match.contains(f'{etag}-gzip'):
+            response = make_response('', 304)
+            response.set_etag(etag)
+            # Mismo Vary que la respuesta 200 (compress_response), que puede venir comprimida
+            response.vary.add('Accept-Encoding')
+            return response
+        
+        response = make_response(view(*args, **kwargs))
+        if response.status_code == 200:
+            response.set_etag(etag)
+            # El navegador puede guardarla, pero debe revalidar en cada uso
+            response.headers['Cache-Control'] = 'no-cache'
+        return response
+    return wrapper
 
-# Cargar datos al iniciar
-df = load_consolidado()
+# Comprimir con gzip las respuestas JSON grandes
+@app.after_request
+def compress_response(response):
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or response.mimetype != 'application/json' or 'Content-Encoding' in response.headers):
+        return response
+    
+    response.vary.add('Accept-Encoding')
+    if 'gzip' not in request.accept_encodings or response.content_length < COMPRESS_MIN_SIZE:
+        return response
+    
+    response.set_data(gzip.compress(response.get_data(), compresslevel=COMPRESS_LEVEL))
+    response.headers['Content-Encoding'] = 'gzip'
+    # Cada representación lleva su propio ETag fuerte
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(f'{etag}-gzip')
+    return response
 
 @app.route('/')
 def index():
-    courses = get_unique_courses(df)
+    courses = cached_unique_courses(g.dataset)
     return render_template('index.html', courses=courses)
 
 @app.route('/api/courses')
+@data_etag
 def api_courses():
-    courses = get_unique_courses(df)
+    courses = cached_unique_courses(g.dataset)
     return jsonify(courses)
 
+# Leer y validar los parámetros de una generación
+def parse_generate_request(data):
+    """
+    Retorna (parámetros, None) o (None, mensaje_de_error) para el cuerpo de
+    /api/generate y /api/generate/jobs.
+    """
+    if not isinstance(data, dict):
+        return None, 'El cuerpo debe ser un objeto JSON'
+    
+    params = {
+        'courses': data.get('courses', []),
+        'group_configs': data.get('groupConfigs', {}),
+        'valid_topones': data.get('validTopones', {}),
+        'limit': data.get('limit', DEFAULT_SCHEDULE_LIMIT),
+        'page_size': data.get('pageSize', PAGE_SIZE),
+        # Permite pedir una página distinta de la primera (p. ej. si el resultado quedó en otro worker)
+        'offset': data.get('offset', 0),
+        'format': data.get('format', 'full'),
+        'scoring': data.get('scoring', {})
+    }
+    
+    print(f"DEBUG - Courses: {params['courses']}")
+    print(f"DEBUG - Group configs: {params['group_configs']}")
+    print(f"DEBUG - Valid topones: {params['valid_topones']}")
+    
+    if len(params['courses']) > 6:
+        return None, 'Máximo 6 cursos permitidos'
+    
+    if len(params['courses']) == 0:
+        return None, 'Selecciona al menos un curso'
+    
+    limit = params['limit']
+    if not isinstance(limit, int) or isinstance(limit, bool) or limit < 1:
+        return None, 'El límite de horarios debe ser un entero positivo'
+    
+    page_size = params['page_size']
+    if not isinstance(page_size, int) or isinstance(page_size, bool) or not 1 <= page_size <= MAX_PAGE_SIZE:
+        return None, f'El tamaño de página debe estar entre 1 y {MAX_PAGE_SIZE}'
+    
+    offset = params['offset']
+    if not isinstance(offset, int) or isinstance(offset, bool) or offset < 0:
+        return None, 'offset debe ser un entero >= 0'
+    
+    if params['format'] not in SCHEDULE_FORMATS:
+        return None, f"format debe ser uno de: {', '.join(SCHEDULE_FORMATS)}"
+    
+    error = valid_topones_error(params['valid_topones'])
+    if error:
+        return None, error
+    
+    params['scoring'], error = parse_scoring(params['scoring'])
+    if error:
+        return None, error
+    
+    return params, None
+
+# Hora HH:MM de las ventanas preferidas
+WINDOW_TIME_PATTERN = re.compile(r'^([01]?\d|2[0-3]):([0-5]\d)$')
+
+# Leer y validar el puntaje pedido
+def parse_scoring(scoring):
+    """
+    scoring: {"weights": {criterio: peso}, "windows": [{"start": "08:30", "end": "13:00"}]}
+    Los criterios que no vienen conservan su peso de SCORE_CRITERIA.
+    Retorna (ScoringEngine, None) o (None, mensaje_de_error).
+    """
+    if not isinstance(scoring, dict):
+        return None, 'scoring debe ser un objeto'
+    
+    weights = scoring.get('weights', {})
+    if not isinstance(weights, dict):
+        return None, 'scoring.weights debe ser un objeto'
+    for name, weight in weights.items():
+        if name not in SCORE_CRITERIA:
+            return None, f"Criterio de puntaje desconocido: {name} (disponibles: {', '.join(SCORE_CRITERIA)})"
+        if not isinstance(weight, (int, float)) or isinstance(weight, bool) or not math.isfinite(weight):
+            return None, f'El peso de {name} debe ser un número'
+    
+    windows = scoring.get('windows', [])
+    if not isinstance(windows, list):
+        return None, 'scoring.windows debe ser una lista'
+    parsed_windows = []
+    for window in windows:
+        times = [window.get(field) if isinstance(window, dict) else None for field in ('start', 'end')]
+        if not all(isinstance(t, str) and WINDOW_TIME_PATTERN.match(t.strip()) for t in times):
+            return None, 'Cada ventana preferida debe tener start y end en formato HH:MM'
+        start, end = (time_to_minutes(t) for t in times)
+        if start >= end:
+            return None, 'Cada ventana preferida debe terminar después de empezar'
+        parsed_windows.append((start, end))
+    
+    # Unir las ventanas que se traslapan (cada minuto cuenta una sola vez)
+    merged = []
+    for start, end in sorted(parsed_windows):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    
+    if weights.get('preferred_window', SCORE_CRITERIA['preferred_window']) and not merged:
+        return None, 'El criterio preferred_window necesita al menos una ventana en scoring.windows'
+    
+    return ScoringEngine(weights, merged), None
+
+# Generar con los parámetros ya validados
+def run_generate(data, params, progress=None):
+    """Retorna (horarios, totales) sobre el Dataset data usando el cache de generaciones"""
+    return generate_schedules_cached(data, params['courses'], group_configs=params['group_configs'],
+                                     valid_topones=params['valid_topones'], include_conflicts=True,
+                                     limit=params['limit'], progress=progress, scoring=params['scoring'])
+
+# Formatos de horario en las respuestas: 'full' (cada horario con sus bloques) o 'compact' (referencias a tablas)
+SCHEDULE_FORMATS = ('full', 'compact')
+
+# Formato compacto de un resultado
+def compact_result(schedules):
+    """
+    Separa los bloques repetidos de un resultado: 'options' es la tabla de
+    opciones de sección (curso, sección, grupo y sus bloques) y 'messages' la
+    de mensajes de topones. Cada horario queda como índices a esas tablas más
+    el score y los tipos. Los índices se asignan en orden de aparición, así que
+    el mismo resultado siempre da las mismas tablas.
+    """
+    options = []
+    option_ids = {}
+    messages = []
+    message_ids = {}
+    
+    def message_id(message):
+        if message not in message_ids:
+            message_ids[message] = len(messages)
+            messages.append(message)
+        return message_ids[message]
+    
+    compact = []
+    for schedule in schedules:
+        refs = []
+        for info in schedule['sections']:
+            key = (info['course'], info['section'], info['group'])
+            if key not in option_ids:
+                option_ids[key] = len(options)
+                blocks = [block for block in schedule['blocks'] if str(block['curso']) == info['course']]
+                options.append(dict(info, blocks=blocks))
+            refs.append(option_ids[key])
+        compact.append({
+            'options': refs,
+            'score': schedule['score'],
+            'conflicts': [message_id(m) for m in schedule['conflicts']],
+            'conflict_types': schedule['conflict_types'],
+            'valid_topones': [message_id(m) for m in schedule['valid_topones']],
+            'valid_topon_types': schedule['valid_topon_types']
+        })
+    
+    return {'options': options, 'messages': messages, 'schedules': compact}
+
+# Horario completo a partir de su forma compacta
+def expand_schedule(schedule, compact):
+    """Inversa de compact_result para un horario (mismo dict que build_schedule)"""
+    options = [compact['options'][i] for i in schedule['options']]
+    conflicts = [compact['messages'][i] for i in schedule['conflicts']]
+    valid_topones_found = [compact['messages'][i] for i in schedule['valid_topones']]
+    return {
+        'sections': [{'course': o['course'], 'section': o['section'], 'group': o['group']} for o in options],
+        'blocks': [block for o in options for block in o['blocks']],
+        'score': schedule['score'],
+        'has_conflicts': len(conflicts) > 0,
+        'has_valid_topones': len(valid_topones_found) > 0,
+        'conflicts': conflicts,
+        'conflict_types': schedule['conflict_types'],
+        'valid_topones': valid_topones_found,
+        'valid_topon_types': schedule['valid_topon_types']
+    }
+
+# Página de un resultado en el formato pedido
+def schedules_page(compact, offset, size, schedule_format):
+    """
+    Retorna los campos de la página para la respuesta a partir del resultado
+    compacto. En formato compacto incluye solo las entradas de las tablas que
+    usa la página (por índice).
+    """
+    page = compact['schedules'][offset:offset + size]
+    if schedule_format != 'compact':
+        return {'schedules': [expand_schedule(schedule, compact) for schedule in page]}
+    
+    option_ids = sorted({i for schedule in page for i in schedule['options']})
+    message_ids = sorted({i for schedule in page for i in schedule['conflicts'] + schedule['valid_topones']})
+    return {
+        'format': 'compact',
+        'schedules': page,
+        'options': {i: compact['options'][i] for i in option_ids},
+        'messages': {i: compact['messages'][i] for i in message_ids}
+    }
+
+# Ruta del archivo de un resultado guardado
+def result_path(result_id):
+    return os.path.join(RESULT_DIR, f'{result_id}.json')
+
+# Guardar un resultado para paginar
+def store_result(schedules, data):
+    """
+    Guarda el resultado en forma compacta, con la versión de los datos con
+    que se generó (data_hash, la misma en todos los workers), en memoria y en
+    RESULT_DIR para que cualquier worker pueda servir sus páginas.
+    Retorna (ID, registro guardado).
+    """
+    record = {'data_version': data.data_hash, 'result': compact_result(schedules)}
+    result_id = result_cache.put(record)
+    try:
+        os.makedirs(RESULT_DIR, exist_ok=True)
+        cleanup_results()
+        fd, tmp_path = tempfile.mkstemp(dir=RESULT_DIR, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(record, f, ensure_ascii=False)
+        os.replace(tmp_path, result_path(result_id))
+    except OSError as e:
+        # Las páginas se siguen sirviendo desde este worker
+        print(f"Error guardando resultado {result_id}: {str(e)}")
+    return result_id, record
+
+# Leer un resultado guardado
+def load_result(result_id):
+    """Retorna el registro de store_result o None si el ID no es válido, no existe o expiró"""
+    record = result_cache.get(result_id)
+    if record is not None or not RESULT_ID_PATTERN.match(result_id):
+        return record
+    path = result_path(result_id)
+    try:
+        if time.time() - os.path.getmtime(path) > RESULT_CACHE_TTL:
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            record = json.load(f)
+        # Renovar la expiración, como en result_cache
+        os.utime(path)
+    except (OSError, json.JSONDecodeError):
+        return None
+    result_cache.put(record, result_id)
+    return record
+
+# Borrar los resultados que no se usan hace más de RESULT_CACHE_TTL segundos
+def cleanup_results():
+    now = time.time()
+    for name in os.listdir(RESULT_DIR):
+        path = os.path.join(RESULT_DIR, name)
+        try:
+            if now - os.path.getmtime(path) > RESULT_CACHE_TTL:
+                os.remove(path)
+        except OSError:
+            pass
+
+# Respuesta de una generación terminada
+def build_generate_response(data, schedules, totals, offset, page_size, schedule_format='full'):
+    """
+    Guarda el resultado para paginar y arma el cuerpo con la página pedida.
+    data: Dataset con que se generó (su data_hash va como data_version)
+    """
+    if not schedules:
+        return {
+            'success': False,
+            'message': 'No se encontraron combinaciones de horarios',
+            'schedules': [],
+            'total': 0,
+            'totals': totals,
+            'data_version': data.data_hash
+        }
+    
+    # Totales reales por nivel (la lista solo trae los mejores 'limit' de cada uno)
+    valid_count = totals['valid']
+    valid_topon_count = totals['valid_topon']
+    conflict_count = totals['conflict']
+    
+    message = f'Se encontraron {valid_count} horarios sin topones'
+    if valid_topon_count > 0:
+        message += f', {valid_topon_count} con topones válidos'
+    if conflict_count > 0:
+        message += f' y {conflict_count} con topones inválidos'
+    
+    # Guardar el resultado completo y enviar solo la página pedida
+    result_id, record = store_result(schedules, data)
+    
+    response = {
+        'success': True,
+        'message': message,
+        'resultId': result_id,
+        'offset': offset,
+        'total': len(schedules),
+        'totals': totals,
+        'data_version': record['data_version']
+    }
+    response.update(schedules_page(record['result'], offset, page_size, schedule_format))
+    return response
+
 @app.route('/api/generate', methods=['POST'])
 def api_generate():
     try:
-        data = request.json
-        selected_courses = data.get('courses', [])
-        group_configs = data.get('groupConfigs', {})
-        valid_topones = data.get('validTopones', {})
-        
-        print(f"DEBUG - Courses: {selected_courses}")
-        print(f"DEBUG - Group configs: {group_configs}")
-        print(f"DEBUG - Valid topones: {valid_topones}")
-        
-        if len(selected_courses) > 6:
-            return jsonify({'error': 'Máximo 6 cursos permitidos'}), 400
+        params, error = parse_generate_request(request.get_json(silent=True))
+        if error:
+            return jsonify({'error': error}), 400
         
-        if len(selected_courses) == 0:
-            return jsonify({'error': 'Selecciona al menos un curso'}), 400
-        
-        schedules = generate_schedules(df, selected_courses, group_configs=group_configs, valid_topones=valid_topones, include_conflicts=True)
+        data = g.dataset
+        schedules, totals = run_generate(data, params)
     except Exception as e:
         print(f"ERROR en api_generate: {str(e)}")
         import traceback
         traceback.print_exc()
         return jsonify({'error': f'Error al generar horarios: {str(e)}'}), 500
     
-    if not schedules:
-        return jsonify({
-            'success': False,
-            'message': 'No se encontraron combinaciones de horarios',
-            'schedules': []
+    return jsonify(build_generate_response(data, schedules, totals, params['offset'], params['page_size'],
+                                           params['format']))
+
+@app.route('/api/generate/stream', methods=['POST'])
+def api_generate_stream():
+    """
+    Igual que /api/generate, pero responde como NDJSON (o SSE si se pide
+    text/event-stream) a medida que avanza la búsqueda. Eventos:
+    {"type": "progress", "evaluated", "total"}, {"type": "schedule", "schedule"}
+    para los primeros horarios sin topones inválidos que se encuentran, y
+    {"type": "end", ...} con el mismo cuerpo que /api/generate (o
+    {"type": "error", "error"}).
+    """
+    params, error = parse_generate_request(request.get_json(silent=True))
+    if error:
+        return jsonify({'error': error}), 400
+    
+    sse = 'text/event-stream' in request.headers.get('Accept', '')
+    # La respuesta se sigue generando después de la petición: fijar la versión de los datos
+    data = g.dataset
+    
+    def encode(event):
+        line = json.dumps(event, ensure_ascii=False)
+        return f"event: {event['type']}\ndata: {line}\n\n" if sse else line + '\n'
+    
+    def events():
+        try:
+            for event, value in iter_generate_schedules(data, params['courses'], group_configs=params['group_configs'],
+                                                        valid_topones=params['valid_topones'], include_conflicts=True,
+                                                        limit=params['limit'], stream_limit=params['page_size'],
+                                                        scoring=params['scoring']):
+                if event == 'progress':
+                    yield encode({'type': 'progress', 'evaluated': value[0], 'total': value[1]})
+                elif event == 'schedule':
+                    yield encode({'type': 'schedule', 'schedule': value})
+                else:
+                    schedules, totals = value
+                    body = build_generate_response(data, schedules, totals, params['offset'],
+                                                   params['page_size'], params['format'])
+                    yield encode(dict(body, type='end'))
+        except Exception as e:
+            print(f"ERROR en api_generate_stream: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            yield encode({'type': 'error', 'error': f'Error al generar horarios: {str(e)}'})
+    
+    mimetype = 'text/event-stream' if sse else 'application/x-ndjson'
+    return Response(events(), mimetype=mimetype, headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# Parámetro entero >= 0 de la URL
+def query_int(name, default):
+    """Retorna el valor, default si no viene, o None si no es un entero >= 0"""
+    value = request.args.get(name)
+    if value is None:
+        return default
+    return int(value) if re.fullmatch(r'[0-9]+', value) else None
+
+@app.route('/api/generate/<result_id>')
+def api_generate_page(result_id):
+    """Entrega una página de un resultado ya generado (?offset=&limit=&format=), desde cualquier worker"""
+    record = load_result(result_id)
+    if record is None:
+        return jsonify({'success': False, 'error': 'El resultado expiró, vuelve a generar los horarios'}), 404
+    
+    # Sin type=int: un valor no numérico debe ser un error, no la página por defecto
+    offset = query_int('offset', 0)
+    limit = query_int('limit', PAGE_SIZE)
+    schedule_format = request.args.get('format', 'full')
+    if offset is None or limit is None or not 1 <= limit <= MAX_PAGE_SIZE:
+        return jsonify({'success': False, 'error': f'offset debe ser >= 0 y limit estar entre 1 y {MAX_PAGE_SIZE}'}), 400
+    if schedule_format not in SCHEDULE_FORMATS:
+        return jsonify({'success': False, 'error': f"format debe ser uno de: {', '.join(SCHEDULE_FORMATS)}"}), 400
+    
+    response = {
+        'success': True,
+        'resultId': result_id,
+        'offset': offset,
+        'total': len(record['result']['schedules']),
+        'data_version': record['data_version']
+    }
+    response.update(schedules_page(record['result'], offset, limit, schedule_format))
+    return jsonify(response)
+
+# Trabajos de generación asíncronos
+# El estado de cada trabajo se guarda como JSON en JOB_DIR para que cualquier worker de gunicorn lo pueda leer
+job_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix='generate-job')
+
+# Ruta del archivo de estado de un trabajo
+def job_path(job_id):
+    return os.path.join(JOB_DIR, f'{job_id}.json')
+
+# Escribir el estado de un trabajo (reemplazo atómico)
+def write_job(job_id, job):
+    job['updated'] = time.time()
+    fd, tmp_path = tempfile.mkstemp(dir=JOB_DIR, suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(job, f, ensure_ascii=False)
+    os.replace(tmp_path, job_path(job_id))
+
+# Leer el estado de un trabajo
+def read_job(job_id):
+    """Retorna el estado guardado o None si el ID no es válido o el trabajo no existe"""
+    if not JOB_ID_PATTERN.match(job_id):
+        return None
+    try:
+        with open(job_path(job_id), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+# Borrar los trabajos que no se actualizan hace más de JOB_TTL segundos
+def cleanup_jobs():
+    now = time.time()
+    for name in os.listdir(JOB_DIR):
+        path = os.path.join(JOB_DIR, name)
+        try:
+            if now - os.path.getmtime(path) > JOB_TTL:
+                os.remove(path)
+        except OSError:
+            pass
+
+# Ejecutar un trabajo de generación e ir guardando su avance
+def run_generate_job(job_id, data, params):
+    job = {'status': 'running', 'evaluated': 0, 'total': 0, 'progress': 0.0, 'partial': []}
+    
+    def progress(evaluated, total, partial):
+        job.update({
+            'evaluated': evaluated,
+            'total': total,
+            'progress': round(evaluated / total, 4) if total else 1.0,
+            'partial': partial
         })
+        write_job(job_id, job)
     
-    valid_count = sum(1 for s in schedules if not s.get('has_conflicts', False) and not s.get('has_valid_topones', False))
-    valid_topon_count = sum(1 for s in schedules if not s.get('has_conflicts', False) and s.get('has_valid_topones', False))
-    conflict_count = sum(1 for s in schedules if s.get('has_conflicts', False))
+    try:
+        write_job(job_id, job)
+        schedules, totals = run_generate(data, params, progress=progress)
+        job.update({
+            'status': 'done',
+            'evaluated': job['total'],
+            'progress': 1.0,
+            'partial': [],
+            'result': build_generate_response(data, schedules, totals, params['offset'], params['page_size'],
+                                              params['format'])
+        })
+    except Exception as e:
+        print(f"ERROR en trabajo {job_id}: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        job.update({'status': 'error', 'error': f'Error al generar horarios: {str(e)}'})
+    write_job(job_id, job)
+
+@app.route('/api/generate/jobs', methods=['POST'])
+def api_generate_job():
+    """Encola una generación y retorna de inmediato el ID del trabajo"""
+    params, error = parse_generate_request(request.get_json(silent=True))
+    if error:
+        return jsonify({'error': error}), 400
     
-    message = f'Se encontraron {valid_count} horarios sin topones'
-    if valid_topon_count > 0:
-        message += f', {valid_topon_count} con topones válidos'
-    if conflict_count > 0:
-        message += f' y {conflict_count} con topones inválidos'
+    try:
+        os.makedirs(JOB_DIR, exist_ok=True)
+        cleanup_jobs()
+        job_id = uuid.uuid4().hex
+        write_job(job_id, {'status': 'queued', 'evaluated': 0, 'total': 0, 'progress': 0.0, 'partial': []})
+        job_executor.submit(run_generate_job, job_id, g.dataset, params)
+    except Exception as e:
+        print(f"ERROR en api_generate_job: {str(e)}")
+        return jsonify({'error': f'Error al crear el trabajo: {str(e)}'}), 500
     
+    return jsonify({'success': True, 'jobId': job_id, 'status': 'queued'}), 202
+
+@app.route('/api/generate/jobs/<job_id>')
+def api_generate_job_status(job_id):
+    """Estado de un trabajo: queued, running (con avance y mejores parciales), done (con el resultado) o error"""
+    job = read_job(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'El trabajo no existe o expiró'}), 404
+    job['jobId'] = job_id
+    return jsonify(job)
+
+@app.route('/api/cache/stats')
+def api_cache_stats():
+    """Estadísticas de los caches de /api/generate"""
     return jsonify({
-        'success': True,
-        'message': message,
-        'schedules': schedules
+        'data_version': g.dataset.version,
+        'generate': generate_cache.stats(),
+        'results': result_cache.stats()
     })
 
 @app.route('/api/course/<course_code>/sections')
 def api_course_sections(course_code):
-    sections = get_course_sections(df, course_code)
+    section_index = g.dataset.section_index
+    sections = get_course_sections(section_index, course_code)
     result = []
     for sec in sections:
-        blocks = get_section_blocks(df, course_code, sec['psec_codigo'], sec['pgru_codigo'])
+        blocks = get_section_blocks(section_index, course_code, sec['psec_codigo'], sec['pgru_codigo'])
         result.append({
             'section': sec['psec_codigo'],
             'group': sec['pgru_codigo'],
-            'blocks': blocks
+            'blocks': [block.to_dict() for block in blocks]
         })
     return jsonify(result)
 
 @app.route('/api/course/<course_code>/structure')
+@data_etag
 def api_course_structure(course_code):
     """Obtiene la estructura de secciones y grupos de un curso para configuración"""
-    sections = get_course_sections(df, course_code)
+    sections = get_course_sections(g.dataset.section_index, course_code)
     # Agrupar por sección
     structure = {}
     for sec in sections:
@@ -705,44 +3210,46 @@ def api_save_config():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/bach1121/schedules')
+@data_etag
 def api_bach1121_schedules():
     """Obtiene todos los horarios individuales de BACH1121 para configurar topones válidos"""
     course_code = 'BACH1121'
     
-    # Filtrar solo BACH1121
-    bach_df = df[df['asig_codigo'] == course_code]
+    # Obtener solo BACH1121 desde el índice de secciones
+    sections = g.dataset.section_index.get(course_code)
     
-    if bach_df.empty:
+    if not sections:
         return jsonify([])
     
     # Crear una lista de cada horario individual
     result = []
     
-    for _, row in bach_df.iterrows():
-        sec = int(row['psec_codigo'])
-        grp = int(row['pgru_codigo'])
-        dia = str(row['sdia_descripcion'])
-        hora_ini = str(row['sper_hora_ini'])
-        hora_fin = str(row['sper_hora_fin'])
-        campus = str(row['camp_campus'])
-        
-        # Determinar tipo de tapón (completo para secciones 1-4, parcial para otras)
-        tapon_type = 'completo' if sec in [1, 2, 3, 4] else 'parcial'
-        
-        # ID único para este horario
-        horario_id = f"{sec}_{grp}_{dia}_{hora_ini}_{hora_fin}"
-        
-        result.append({
-            'id': horario_id,
-            'section': sec,
-            'group': grp,
-            'dia': dia,
-            'hora_ini': hora_ini,
-            'hora_fin': hora_fin,
-            'tapon_type': tapon_type,
-            'campus': campus,
-            'display': f"Sección {sec} - {dia} {hora_ini} a {hora_fin} ({tapon_type})"
-        })
+    for sec, groups in sections.items():
+        for grp, blocks in groups.items():
+            for block in blocks:
+                dia = block.dia
+                hora_ini = block.hora_ini
+                hora_fin = block.hora_fin
+                campus = block.campus
+                
+                # Determinar tipo de tapón (completo para secciones 1-4, parcial para otras)
+                tapon_type = 'completo' if sec in [1, 2, 3, 4] else 'parcial'
+                
+                # ID único para este horario
+                horario_id = f"{sec}_{grp}_{dia}_{hora_ini}_{hora_fin}"
+                
+                result.append({
+                    'id': horario_id,
+                    'course': course_code,
+                    'section': sec,
+                    'group': grp,
+                    'dia': dia,
+                    'hora_ini': hora_ini,
+                    'hora_fin': hora_fin,
+                    'tapon_type': tapon_type,
+                    'campus': campus,
+                    'display': f"Sección {sec} - {dia} {hora_ini} a {hora_fin} ({tapon_type})"
+                })
     
     # Ordenar por sección, día y hora
     dias_orden = {'Lunes': 1, 'Martes': 2, 'Miercoles': 3, 'Miércoles': 3, 'Jueves': 4, 'Viernes': 5, 'Sabado': 6, 'Sábado': 6}
@@ -751,17 +3258,20 @@ def api_bach1121_schedules():
     return jsonify(result)
 
 @app.route('/api/data/all')
+@data_etag
 def api_get_all_data():
     """Obtiene todos los datos del Excel para edición"""
     try:
         # Convertir el DataFrame a lista de diccionarios
+        df = g.dataset.df
         data = df.to_dict('records')
         
-        # Convertir valores NaN a None para JSON
-        for row in data:
+        # Convertir valores NaN a None para JSON; '_id' identifica la fila en /api/data/rows
+        for row_id, row in zip(df.index, data):
             for key, value in row.items():
                 if pd.isna(value):
                     row[key] = None
+            row['_id'] = int(row_id)
         
         return jsonify({
             'success': True,
@@ -772,30 +3282,297 @@ def api_get_all_data():
         print(f"Error obteniendo datos: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+# Compactación diferida del diario en consolidado.xlsx
+class DeferredExcelWriter:
+    """
+    Junta las ediciones por fila y compacta (write_consolidado) en un hilo
+    aparte cuando pasan 'delay' segundos sin cambios, o 'max_delay' desde la
+    primera edición pendiente. flush() compacta de inmediato lo pendiente;
+    exclusive() descarta lo pendiente y bloquea la compactación mientras otra
+    parte del código escribe el Excel.
+    """
+    
+    def __init__(self, delay, max_delay):
+        self.delay = delay
+        self.max_delay = max_delay
+        self._timer = None
+        self._pending_since = None
+        self._pending = False
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+    
+    def schedule(self):
+        """Marca datos pendientes y reinicia la espera (sin pasar de max_delay)"""
+        with self._lock:
+            now = time.monotonic()
+            if not self._pending:
+                self._pending_since = now
+            self._pending = True
+            if self._timer is not None:
+                self._timer.cancel()
+            delay = max(0.0, min(self.delay, self._pending_since + self.max_delay - now))
+            self._timer = threading.Timer(delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+    
+    def _take_pending(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            pending = self._pending
+            self._pending = False
+            return pending
+    
+    def flush(self):
+        """Escribe los datos actuales si hay ediciones pendientes; retorna False si la escritura falló"""
+        with self._write_lock:
+            if not self._take_pending():
+                return True
+            try:
+                write_consolidado()
+            except Exception as e:
+                print(f"Error escribiendo consolidado.xlsx: {str(e)}")
+                with self._lock:
+                    self._pending = True
+                return False
+            return True
+    
+    @contextlib.contextmanager
+    def exclusive(self):
+        with self._write_lock:
+            self._take_pending()
+            yield
+
+# Ponerse al día con las ediciones de otros procesos
+def sync_with_store():
+    """
+    Aplica las ediciones que otros procesos guardaron, o recarga todo si los
+    datos fueron reemplazados o compactados. Requiere store.locked().
+    """
+    entries = store.read_changes()
+    if entries is None:
+        with data_lock:
+            publish_data(*store.load())
+        return
+    
+    if entries:
+        with data_lock:
+            current = dataset
+            new_df, new_index, new_hash, affected = apply_journal_entries(current.df, current.section_index,
+                                                                          current.data_hash, entries)
+            publish_data(new_df, new_index, new_hash, changed_courses=affected)
+
+# Compactar: pasar los datos actuales al Excel y vaciar el diario
+def write_consolidado():
+    """
+    Escribe consolidado.xlsx de forma atómica y el snapshot con todas las
+    ediciones aplicadas, y reinicia el diario. El snapshot se escribe antes de
+    reemplazar el Excel: si el proceso cae entre ambos pasos, al iniciar se
+    reconoce que el snapshot es más nuevo (previous_sha256) y no se pierde nada.
+    """
+    excel_path = os.path.join(os.path.dirname(__file__), 'consolidado.xlsx')
+    tmp_path = f"{excel_path}.{os.getpid()}.tmp.xlsx"
+    
+    with journal.locked():
+        sync_with_store()
+        with data_lock:
+            current, seq = dataset, journal.seq
+        current_df, current_index = current.df, current.section_index
+        
+        try:
+            current_df.to_excel(tmp_path, index=False, engine='openpyxl')
+            with open(tmp_path, 'rb+') as f:
+                os.fsync(f.fileno())
+            excel_sha256 = file_sha256(tmp_path)
+            previous_sha256 = file_sha256(excel_path) if os.path.exists(excel_path) else None
+            # El hash de los datos no cambia: es el que los demás procesos leen del snapshot al recargar
+            if not save_snapshot(os.stat(tmp_path), excel_sha256, current_df, current_index, seq, previous_sha256,
+                                 data_hash=current.data_hash):
+                raise OSError('no se pudo guardar el snapshot')
+            os.replace(tmp_path, excel_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        journal.reset(seq)
+
+excel_writer = DeferredExcelWriter(EXCEL_WRITE_DELAY, EXCEL_WRITE_MAX_DELAY)
+# No perder ediciones pendientes al detener el proceso
+atexit.register(excel_writer.flush)
+
+# Compactar lo que la carga dejó solo en el diario o en el snapshot. Se programa con la primera
+# petición y no al importar: con preload_app el módulo se importa en el proceso maestro de gunicorn,
+# y el hilo del Timer no pasa a los workers creados con fork
+@app.before_request
+def schedule_pending_compaction():
+    if journal.needs_compaction:
+        journal.needs_compaction = False
+        excel_writer.schedule()
+
+# Aplicar una edición por fila
+def apply_row_edit(row_id, values):
+    """
+    Agrega (row_id None), actualiza (values con las columnas a cambiar) o borra
+    (values None) una fila. La edición se guarda (store.append) antes de
+    aplicarse; después se reconstruyen solo los cursos afectados del índice
+    y se publican los datos.
+    Retorna (fila normalizada o None, ID de la fila, versión de los datos
+    publicada). Lanza KeyError si la fila no existe y ValueError si los
+    valores no son válidos.
+    """
+    with store.locked():
+        sync_with_store()
+        with data_lock:
+            current = dataset.df
+            affected = set()
+            row = None
+            
+            if row_id is not None:
+                if row_id not in current.index:
+                    raise KeyError(row_id)
+                affected.add(str(current.at[row_id, 'asig_codigo']))
+            
+            if values is not None:
+                merged = {} if row_id is None else current.loc[row_id].to_dict()
+                merged.update(values)
+                row, error = normalize_row(merged, list(current.columns))
+                if error:
+                    raise ValueError(error)
+                affected.add(row['asig_codigo'])
+            
+            if values is None:
+                op = 'delete'
+            elif row_id is None:
+                op = 'insert'
+                row_id = int(current.index.max()) + 1 if len(current) else 0
+            else:
+                op = 'update'
+            new_df = edit_frame(current, op, row_id, row)
+            new_hash = chain_data_hash(dataset.data_hash, op, row_id, row)
+            
+            # Primero al almacenamiento: si falla, la edición no se aplica
+            store.append(op, row_id, row, new_hash)
+            
+            new_index = update_section_index(dataset.section_index, new_df, affected)
+            published = publish_data(new_df, new_index, new_hash, changed_courses=affected)
+        data_stamp.touch()
+    
+    return row, row_id, published.version
+
+# Fila en formato JSON (como en /api/data/all)
+def row_to_json(row, row_id):
+    return dict({key: (None if value is not None and not isinstance(value, str) and pd.isna(value) else value)
+                 for key, value in row.items()}, _id=int(row_id))
+
+# Leer el cuerpo de una edición por fila
+def row_edit_body():
+    """
+    Retorna (valores, None) o (None, mensaje_de_error). El cuerpo debe ser un
+    objeto con al menos una columna y solo columnas conocidas, así una
+    petición vacía no se guarda como una edición sin cambios.
+    """
+    values = request.get_json(silent=True)
+    if not isinstance(values, dict) or not any(column != '_id' for column in values):
+        return None, 'El cuerpo debe ser un objeto con las columnas de la fila'
+    unknown = [column for column in values if column not in g.dataset.df.columns and column != '_id']
+    if unknown:
+        return None, f'Columnas desconocidas: {", ".join(map(str, unknown))}'
+    return values, None
+
+@app.route('/api/data/rows', methods=['POST'])
+def api_insert_row():
+    """Agrega una fila (con STORAGE_BACKEND=excel el Excel se escribe en segundo plano)"""
+    values, error = row_edit_body()
+    if error:
+        return jsonify({'success': False, 'error': error}), 400
+    try:
+        row, row_id, version = apply_row_edit(None, values)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        print(f"Error agregando fila: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+    return jsonify({'success': True, 'row': row_to_json(row, row_id), 'data_version': version}), 201
+
+@app.route('/api/data/rows/<int:row_id>', methods=['PATCH'])
+def api_update_row(row_id):
+    """Cambia las columnas enviadas de una fila (con STORAGE_BACKEND=excel el Excel se escribe en segundo plano)"""
+    values, error = row_edit_body()
+    if error:
+        return jsonify({'success': False, 'error': error}), 400
+    try:
+        row, row_id, version = apply_row_edit(row_id, values)
+    except KeyError:
+        return jsonify({'success': False, 'error': 'La fila no existe'}), 404
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        print(f"Error actualizando fila: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+    return jsonify({'success': True, 'row': row_to_json(row, row_id), 'data_version': version})
+
+@app.route('/api/data/rows/<int:row_id>', methods=['DELETE'])
+def api_delete_row(row_id):
+    """Borra una fila (con STORAGE_BACKEND=excel el Excel se escribe en segundo plano)"""
+    try:
+        _, _, version = apply_row_edit(row_id, None)
+    except KeyError:
+        return jsonify({'success': False, 'error': 'La fila no existe'}), 404
+    except Exception as e:
+        print(f"Error borrando fila: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+    return jsonify({'success': True, 'data_version': version})
+
+@app.route('/api/data/flush', methods=['POST'])
+def api_flush_data():
+    """Escribe ya en el Excel las ediciones por fila pendientes"""
+    if not store.flush():
+        return jsonify({'success': False, 'error': 'No se pudieron guardar los datos'}), 500
+    return jsonify({'success': True, 'message': 'Datos guardados correctamente', 'total': len(dataset.df),
+                    'data_version': dataset.version})
+
+# Respuesta con los errores por fila de un guardado o importación (no se guarda nada)
+def row_errors_response(errors):
+    return jsonify({
+        'success': False,
+        'error': f'{len(errors)} filas con errores; no se guardaron los datos',
+        'errors': [{'row': line, 'error': message} for line, message in errors[:IMPORT_MAX_ERRORS]]
+    }), 400
+
 @app.route('/api/data/save', methods=['POST'])
 def api_save_data():
     """Guarda los datos editados en el Excel"""
-    global df
     try:
         data = request.json.get('data', [])
         
         if not data:
             return jsonify({'success': False, 'error': 'No se recibieron datos'}), 400
         
-        # Crear nuevo DataFrame con los datos recibidos
-        new_df = pd.DataFrame(data)
+        # Validar y normalizar las filas recibidas (sin el '_id' de /api/data/all)
+        columns = [column for column in data[0] if column != '_id']
+        missing = [column for column in REQUIRED_COLUMNS if column not in columns]
+        if missing:
+            return jsonify({'success': False, 'error': f'Faltan columnas requeridas: {", ".join(missing)}'}), 400
+        new_df, errors, _ = normalize_rows(columns, ((line, {column: row.get(column) for column in columns})
+                                                     for line, row in enumerate(data, start=1)))
+        if errors:
+            return row_errors_response(errors)
         
-        # Guardar en el archivo Excel
-        excel_path = os.path.join(os.path.dirname(__file__), 'consolidado.xlsx')
-        new_df.to_excel(excel_path, index=False)
+        # El índice se arma antes de tomar los locks: mientras tanto se siguen atendiendo
+        # peticiones (y ediciones) con la versión anterior
+        new_index = build_section_index(new_df)
         
-        # Recargar el DataFrame global
-        df = load_consolidado()
+        # Guardar y publicar los datos (reemplaza las ediciones por fila que estuvieran pendientes)
+        with excel_writer.exclusive(), store.locked():
+            with data_lock:
+                published = publish_data(*store.replace(new_df, new_index))
+            data_stamp.touch()
         
         return jsonify({
             'success': True,
             'message': 'Datos guardados correctamente',
-            'total': len(new_df)
+            'total': len(new_df),
+            'data_version': published.version
         })
     except Exception as e:
         print(f"Error guardando datos: {str(e)}")
@@ -805,9 +3582,8 @@ def api_save_data():
 def api_export_data():
     """Exporta el Excel actual"""
     try:
-        excel_path = os.path.join(os.path.dirname(__file__), 'consolidado.xlsx')
         return send_file(
-            excel_path,
+            store.export(),
             mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
             as_attachment=True,
             download_name='consolidado_export.xlsx'
@@ -819,7 +3595,6 @@ def api_export_data():
 @app.route('/api/data/import', methods=['POST'])
 def api_import_data():
     """Importa un archivo Excel y reemplaza los datos actuales"""
-    global df
     try:
         if 'file' not in request.files:
             return jsonify({'success': False, 'error': 'No se recibió ningún archivo'}), 400
@@ -832,52 +3607,41 @@ def api_import_data():
         if not file.filename.endswith(('.xlsx', '.xls')):
             return jsonify({'success': False, 'error': 'El archivo debe ser un Excel (.xlsx o .xls)'}), 400
         
-        # Leer el archivo Excel cargado
-        imported_df = pd.read_excel(file)
-        
-        # Validar que tenga las columnas esperadas (soporta ambos formatos)
-        # Formato nuevo: CODIGO CURSO, NOMBRE CURSO, SECCION, GRUPO, DIA, HORA INICIO, HORA FIN, CAMPUS
-        # Formato antiguo: asig_codigo, asig_nombre, psec_codigo, pgru_codigo, sdia_descripcion, sper_hora_ini, sper_hora_fin, camp_campus
-        
-        has_new_format = 'CODIGO CURSO' in imported_df.columns
-        has_old_format = 'asig_codigo' in imported_df.columns
-        
-        if not has_new_format and not has_old_format:
-            return jsonify({
-                'success': False, 
-                'error': 'El archivo no tiene el formato correcto. Debe tener columnas: CODIGO CURSO, NOMBRE CURSO, SECCION, GRUPO, DIA, HORA INICIO, HORA FIN, CAMPUS (nuevo formato) o asig_codigo, asig_nombre, psec_codigo, pgru_codigo, sdia_descripcion, sper_hora_ini, sper_hora_fin, camp_campus (formato antiguo)'
-            }), 400
-        
-        # Validar columnas según el formato detectado
-        if has_new_format:
-            required_columns = ['CODIGO CURSO', 'NOMBRE CURSO', 'SECCION', 'GRUPO', 
-                              'DIA', 'HORA INICIO', 'HORA FIN', 'CAMPUS']
-        else:
-            required_columns = ['asig_codigo', 'asig_nombre', 'psec_codigo', 'pgru_codigo', 
-                              'sdia_descripcion', 'sper_hora_ini', 'sper_hora_fin', 'camp_campus']
-        
-        missing_columns = [col for col in required_columns if col not in imported_df.columns]
-        if missing_columns:
-            return jsonify({
-                'success': False, 
-                'error': f'Faltan columnas requeridas: {", ".join(missing_columns)}'
-            }), 400
-        
-        # Guardar el archivo importado
-        excel_path = os.path.join(os.path.dirname(__file__), 'consolidado.xlsx')
-        imported_df.to_excel(excel_path, index=False)
-        
-        # Recargar el DataFrame global
-        df = load_consolidado()
+        # Guardar la subida junto a consolidado.xlsx (así puede reemplazarlo sin copiarlo)
+        extension = os.path.splitext(file.filename)[1].lower()
+        upload_path = os.path.join(os.path.dirname(__file__), f'consolidado.upload-{uuid.uuid4().hex}{extension}')
+        file.save(upload_path)
+        try:
+            # Una sola lectura: cada fila se valida y normaliza al leerla
+            try:
+                imported_df, errors, skipped = normalize_rows(*read_excel_rows(upload_path))
+            except ValueError as e:
+                return jsonify({'success': False, 'error': str(e)}), 400
+            if errors:
+                return row_errors_response(errors)
+            
+            # Lectura e índice fuera de los locks: mientras tanto se sigue usando la versión anterior
+            new_index = build_section_index(imported_df)
+            with excel_writer.exclusive(), store.locked():
+                with data_lock:
+                    published = publish_data(*store.replace(imported_df, new_index,
+                                                            upload_path if extension == '.xlsx' else None))
+                data_stamp.touch()
+        finally:
+            if os.path.exists(upload_path):
+                os.remove(upload_path)
         
         return jsonify({
             'success': True,
             'message': 'Archivo importado correctamente',
-            'total': len(imported_df)
+            'total': len(imported_df),
+            'skipped': skipped,
+            'data_version': published.version
         })
     except Exception as e:
         print(f"Error importando datos: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+# Servidor de desarrollo; en producción se usa gunicorn (gunicorn.conf.py)
 if __name__ == '__main__':
     app.run(host='0.0.0.0', debug=True, port=5000)
@@ -0,0 +1,24 @@
+# Configuración de gunicorn para producción (detrás de nginx)
+# Uso: gunicorn -c gunicorn.conf.py app:app
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+
+# Procesos y threads por proceso (configurables por variables de entorno)
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+worker_class = 'gthread'
+
+# Cargar app.py (y consolidado.xlsx) una sola vez antes de crear los workers:
+# los datos de solo lectura se comparten por copy-on-write
+preload_app = True
+
+# Las generaciones grandes pueden tardar; nginx debe tener un timeout similar
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '120'))
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('LOG_LEVEL', 'info')
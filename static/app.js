@@ -1,7 +1,13 @@
 // Estado de la aplicación
 let selectedCourses = [];
-let schedules = [];
+let schedules = [];  // Páginas ya descargadas del resultado
+let schedulesTotal = 0;  // Total de horarios en el resultado del servidor
+let resultId = null;  // ID del resultado guardado en el servidor para pedir más páginas
+let resultDataVersion = null;  // Versión de los datos de la primera página (las siguientes deben coincidir)
+let generateRequest = null;  // Última petición a /api/generate (para regenerar páginas si el resultado expiró)
 let currentScheduleIndex = 0;
+let scheduleOptions = {};  // Tabla de opciones de sección del resultado compacto (id -> curso, sección, grupo, bloques)
+let scheduleMessages = {};  // Tabla de mensajes de topones del resultado compacto (id -> texto)
 
 // Configuración de grupos obligatorios
 // Formato: { 'CES1159_1': { section: 1, groups: [0, 1] } }
@@ -135,6 +141,7 @@ function addToponConfig() {
     // Agregar a la configuración
     toponesConfigs[horarioId] = {
         id: horarioId,
+        course: horario.course,
         section: horario.section,
         group: horario.group,
         dia: horario.dia,
@@ -505,19 +512,28 @@ async function generateSchedules() {
     btn.disabled = true;
     
     try {
-        const response = await fetch('/api/generate', {
+        generateRequest = {
+            courses: selectedCourses.map(c => c.code),
+            groupConfigs: groupConfigs,  // Enviar configuración de grupos
+            validTopones: toponesConfigs,  // Enviar topones válidos (puede estar vacío)
+            format: 'compact'  // Horarios como referencias a tablas de opciones y mensajes
+        };
+        // El servidor responde como NDJSON: avance, primeros horarios encontrados y al final el resultado ordenado
+        const response = await fetch('/api/generate/stream', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
             },
-            body: JSON.stringify({
-                courses: selectedCourses.map(c => c.code),
-                groupConfigs: groupConfigs,  // Enviar configuración de grupos
-                validTopones: toponesConfigs  // Enviar topones válidos (puede estar vacío)
-            })
+            body: JSON.stringify(generateRequest)
         });
         
-        const data = await response.json();
+        if (!response.ok) {
+            const error = await response.json();
+            showAlert(error.error || 'Error al generar horarios');
+            return;
+        }
+        
+        const data = await readGenerateStream(response, btn);
         
         if (data.error) {
             showAlert(data.error);
@@ -525,16 +541,23 @@ async function generateSchedules() {
         }
         
         schedules = data.schedules;
+        schedulesTotal = data.total;
+        resultId = data.resultId || null;
+        resultDataVersion = data.data_version || null;
         currentScheduleIndex = 0;
+        scheduleOptions = {};
+        scheduleMessages = {};
+        mergeScheduleTables(data);
         
         if (schedules.length === 0) {
             showAlert('No se encontraron combinaciones de horarios. Verifica que los cursos tengan secciones disponibles.');
             document.getElementById('resultsPanel').style.display = 'none';
         } else {
             // Contar horarios: válidos, con topones válidos, con conflictos
-            const validCount = schedules.filter(s => !s.has_conflicts && !s.has_valid_topones).length;
-            const validToponCount = schedules.filter(s => !s.has_conflicts && s.has_valid_topones).length;
-            const conflictCount = schedules.filter(s => s.has_conflicts).length;
+            // (totales del servidor; la lista solo trae los mejores de cada nivel)
+            const validCount = data.totals.valid;
+            const validToponCount = data.totals.valid_topon;
+            const conflictCount = data.totals.conflict;
             
             let message = '';
             if (validCount > 0) {
@@ -560,11 +583,79 @@ async function generateSchedules() {
     }
 }
 
+// Leer la respuesta de /api/generate/stream mostrando los horarios a medida que llegan
+async function readGenerateStream(response, btn) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let streamed = 0;
+    
+    while (true) {
+        const { value, done } = await reader.read();
+        buffer += decoder.decode(value || new Uint8Array(), { stream: !done });
+        
+        const lines = buffer.split('\n');
+        buffer = done ? '' : lines.pop();
+        
+        for (const line of lines) {
+            if (!line.trim()) continue;
+            const event = JSON.parse(line);
+            
+            if (event.type === 'end' || event.type === 'error') {
+                return event;
+            }
+            if (event.type === 'progress') {
+                const percent = Math.floor(event.evaluated / event.total * 100);
+                btn.innerHTML = `<span class="loading"></span> Generando... ${percent}%`;
+            } else if (event.type === 'schedule') {
+                // Vista previa: se reemplaza por el resultado ordenado al terminar
+                if (streamed === 0) {
+                    schedules = [];
+                    resultId = null;
+                    currentScheduleIndex = 0;
+                }
+                streamed++;
+                schedules.push(event.schedule);
+                schedulesTotal = schedules.length;
+                displaySchedule();
+            }
+        }
+        
+        if (done) {
+            return { error: 'La generación terminó sin resultado' };
+        }
+    }
+}
+
+// Agregar las tablas de una página en formato compacto
+function mergeScheduleTables(data) {
+    Object.assign(scheduleOptions, data.options || {});
+    Object.assign(scheduleMessages, data.messages || {});
+}
+
+// Convertir un horario compacto (referencias a las tablas) al formato completo
+function resolveSchedule(schedule) {
+    if (schedule.blocks) return schedule;  // Ya viene completo (p. ej. vista previa del stream)
+    
+    const options = schedule.options.map(id => scheduleOptions[id]);
+    return {
+        sections: options.map(o => ({ course: o.course, section: o.section, group: o.group })),
+        blocks: options.flatMap(o => o.blocks),
+        score: schedule.score,
+        has_conflicts: schedule.conflicts.length > 0,
+        has_valid_topones: schedule.valid_topones.length > 0,
+        conflicts: schedule.conflicts.map(id => scheduleMessages[id]),
+        conflict_types: schedule.conflict_types,
+        valid_topones: schedule.valid_topones.map(id => scheduleMessages[id]),
+        valid_topon_types: schedule.valid_topon_types
+    };
+}
+
 // Mostrar horario actual
 function displaySchedule() {
     if (schedules.length === 0) return;
 
-    const schedule = schedules[currentScheduleIndex];
+    const schedule = resolveSchedule(schedules[currentScheduleIndex]);
     const resultsPanel = document.getElementById('resultsPanel');
     const scheduleGrid = document.getElementById('scheduleGrid');
     const scheduleInfo = document.getElementById('scheduleInfo');
@@ -573,9 +664,9 @@ function displaySchedule() {
     resultsPanel.style.display = 'block';
 
     // Actualizar contador y botones de navegación
-    scheduleCounter.textContent = `${currentScheduleIndex + 1} / ${schedules.length}`;
+    scheduleCounter.textContent = `${currentScheduleIndex + 1} / ${schedulesTotal}`;
     document.getElementById('prevBtn').disabled = currentScheduleIndex === 0;
-    document.getElementById('nextBtn').disabled = currentScheduleIndex === schedules.length - 1;
+    document.getElementById('nextBtn').disabled = currentScheduleIndex === schedulesTotal - 1;
 
     // Mostrar cartel de topones si hay conflictos
     let conflictHTML = '';
@@ -871,10 +962,60 @@ function prevSchedule() {
     }
 }
 
-function nextSchedule() {
-    if (currentScheduleIndex < schedules.length - 1) {
-        currentScheduleIndex++;
-        displaySchedule();
+async function nextSchedule() {
+    if (currentScheduleIndex >= schedulesTotal - 1) return;
+    
+    // Pedir la siguiente página al servidor si aún no está descargada
+    if (currentScheduleIndex + 1 >= schedules.length) {
+        const loaded = await loadMoreSchedules();
+        if (!loaded) return;
+    }
+    
+    currentScheduleIndex++;
+    displaySchedule();
+}
+
+// Descargar la siguiente página del resultado guardado en el servidor
+async function loadMoreSchedules() {
+    const nextBtn = document.getElementById('nextBtn');
+    nextBtn.disabled = true;
+    
+    try {
+        let response = await fetch(`/api/generate/${resultId}?offset=${schedules.length}&format=compact`);
+        
+        // El resultado expiró: pedir la página regenerando (usa el cache del servidor)
+        if (response.status === 404) {
+            response = await fetch('/api/generate', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json'
+                },
+                body: JSON.stringify({ ...generateRequest, offset: schedules.length })
+            });
+        }
+        
+        const data = await response.json();
+        if (!data.success) {
+            showAlert(data.error || 'Error al cargar más horarios');
+            return false;
+        }
+        
+        // Una página de otra versión de los datos no calza con las ya descargadas
+        if (data.data_version !== resultDataVersion) {
+            showAlert('Los datos cambiaron desde que se generaron estos horarios; vuelve a generarlos');
+            return false;
+        }
+        resultId = data.resultId;
+        
+        mergeScheduleTables(data);
+        schedules = schedules.concat(data.schedules);
+        return data.schedules.length > 0;
+    } catch (error) {
+        showAlert('Error al cargar más horarios');
+        console.error(error);
+        return false;
+    } finally {
+        nextBtn.disabled = currentScheduleIndex === schedulesTotal - 1;
     }
 }
 
@@ -1037,23 +1178,122 @@ function displayDataTable() {
     document.getElementById('rowsPerPage').style.display = 'none';
 }
 
-// Actualizar celda
-function updateCell(index, field, value) {
-    if (excelData[index]) {
-        excelData[index][field] = value;
+// Enviar una edición de fila al servidor (/api/data/rows)
+async function sendRowEdit(method, url, body) {
+    const options = { method: method, headers: { 'Content-Type': 'application/json' } };
+    if (body !== undefined) {
+        options.body = JSON.stringify(body);
+    }
+    const response = await fetch(url, options);
+    return response.json();
+}
+
+// Campos que debe tener una fila nueva antes de enviarse al servidor
+const REQUIRED_ROW_FIELDS = ['asig_codigo', 'psec_codigo', 'pgru_codigo', 'sdia_descripcion',
+                             'sper_hora_ini', 'sper_hora_fin', 'camp_campus'];
+
+function isRowComplete(row) {
+    return REQUIRED_ROW_FIELDS.every(field => row[field] !== null && row[field] !== undefined &&
+                                              String(row[field]).trim() !== '');
+}
+
+// Actualizar celda (se guarda de inmediato solo esa fila)
+async function updateCell(index, field, value) {
+    const row = excelData[index];
+    if (!row) return;
+    
+    // Fila nueva: queda solo en el navegador hasta que tenga los campos obligatorios
+    if (row._draft) {
+        row[field] = value;
+        if (!row._sending && isRowComplete(row)) {
+            await submitDraftRow(row);
+        }
+        return;
+    }
+    
+    const previous = row[field];
+    row[field] = value;
+    try {
+        const result = await sendRowEdit('PATCH', `/api/data/rows/${row._id}`, { [field]: value });
+        if (result.success) {
+            // Valores normalizados por el servidor (día, horas, campus)
+            Object.assign(row, result.row);
+            return;
+        }
+        showToast('Error guardando cambio: ' + result.error, 'error');
+    } catch (error) {
+        console.error('Error:', error);
+        showToast('Error guardando cambio en el servidor', 'error');
+    }
+    // El servidor rechazó el cambio: volver a mostrar el valor guardado
+    row[field] = previous;
+    displayDataTable();
+}
+
+// Enviar una fila nueva que ya tiene los campos obligatorios
+async function submitDraftRow(row) {
+    const values = {};
+    for (const [field, value] of Object.entries(row)) {
+        if (!field.startsWith('_')) values[field] = value;
+    }
+    
+    row._sending = true;
+    try {
+        const result = await sendRowEdit('POST', '/api/data/rows', values);
+        if (!result.success) {
+            showToast('Error agregando registro: ' + result.error, 'error');
+            return;
+        }
+        const index = excelData.indexOf(row);
+        if (index === -1) {
+            // Se eliminó mientras se enviaba
+            await sendRowEdit('DELETE', `/api/data/rows/${result.row._id}`);
+            return;
+        }
+        excelData[index] = result.row;
+        displayDataTable();
+        showToast('Nuevo registro agregado', 'success');
+        
+        // Cambios hechos mientras se enviaba la fila
+        for (const field of Object.keys(values)) {
+            if (row[field] !== values[field]) {
+                await updateCell(index, field, row[field]);
+            }
+        }
+    } catch (error) {
+        console.error('Error:', error);
+        showToast('Error agregando registro en el servidor', 'error');
+    } finally {
+        row._sending = false;
     }
 }
 
 // Eliminar fila
-function deleteRow(index) {
+async function deleteRow(index) {
     if (confirm('¿Estás seguro de eliminar este registro?')) {
-        excelData.splice(index, 1);
-        displayDataTable();
-        showToast('Registro eliminado', 'info');
+        if (excelData[index]._draft) {
+            // Fila nueva que aún no está en el servidor
+            excelData.splice(index, 1);
+            displayDataTable();
+            return;
+        }
+        try {
+            const result = await sendRowEdit('DELETE', `/api/data/rows/${excelData[index]._id}`);
+            if (!result.success) {
+                showToast('Error eliminando registro: ' + result.error, 'error');
+                return;
+            }
+            excelData.splice(index, 1);
+            displayDataTable();
+            showToast('Registro eliminado', 'info');
+        } catch (error) {
+            console.error('Error:', error);
+            showToast('Error eliminando registro en el servidor', 'error');
+        }
     }
 }
 
-// Agregar nueva fila
+// Agregar nueva fila (se envía al servidor cuando se completan los campos obligatorios)
 function addNewRow() {
     const newRow = {
         sare_anho: 2024,
@@ -1073,24 +1313,23 @@ function addNewRow() {
         camp_campus: '',
         tsal_tipo: null,
         ambiente_especifico: null,
-        sare_comentario: null
+        sare_comentario: null,
+        _draft: true
     };
     
     excelData.push(newRow);
     displayDataTable();
-    showToast('Nuevo registro agregado', 'success');
+    showToast('Completa código, sección, grupo, día, horas y campus para guardar el registro', 'info');
 }
 
-// Guardar cambios en el Excel
+// Guardar cambios en el Excel (las ediciones ya están en el servidor; se fuerza la escritura pendiente)
 async function saveExcelData() {
+    const drafts = excelData.filter(row => row._draft).length;
+    if (drafts && !confirm(`Hay ${drafts} registros nuevos incompletos que no se guardarán. ¿Continuar?`)) {
+        return;
+    }
     try {
-        const response = await fetch('/api/data/save', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
-            },
-            body: JSON.stringify({ data: excelData })
-        });
+        const response = await fetch('/api/data/flush', { method: 'POST' });
         
         const result = await response.json();
         
@@ -1138,7 +1377,10 @@ async function importData(event) {
             showToast('Archivo importado correctamente', 'success');
             await loadExcelData();
         } else {
-            showToast('Error importando: ' + result.error, 'error');
+            // Errores por fila: mostrar los primeros y dejar el detalle en la consola
+            const rowErrors = (result.errors || []).slice(0, 3).map(e => `fila ${e.row}: ${e.error}`);
+            if (result.errors) console.warn('Errores de importación:', result.errors);
+            showToast('Error importando: ' + [result.error, ...rowErrors].join(' — '), 'error');
         }
     } catch (error) {
         console.error('Error:', error);
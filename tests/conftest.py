@@ -0,0 +1,47 @@
+"""
+Las pruebas usan copias de la aplicación en carpetas temporales: app.py carga
+consolidado.xlsx al importarse y escribe junto a él (snapshot, diario), así
+que nunca se importa desde el repositorio.
+"""
+import shutil
+from pathlib import Path
+
+import pytest
+
+REPO = Path(__file__).resolve().parent.parent
+
+
+def copy_app(app_dir):
+    app_dir.mkdir()
+    for name in ('app.py', 'consolidado.xlsx', 'config.json'):
+        if (REPO / name).exists():
+            shutil.copy(REPO / name, app_dir / name)
+    for name in ('static', 'templates'):
+        shutil.copytree(REPO / name, app_dir / name, ignore=shutil.ignore_patterns('*.gz'))
+    return app_dir
+
+
+@pytest.fixture
+def workdir(tmp_path):
+    """Copia de la aplicación para correrla en otros procesos"""
+    return copy_app(tmp_path / 'app')
+
+
+@pytest.fixture(scope='session')
+def app_module(tmp_path_factory):
+    """Módulo app importado (una vez por sesión) desde una copia"""
+    app_dir = copy_app(tmp_path_factory.mktemp('session') / 'app')
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setenv('STORAGE_BACKEND', 'excel')
+        patch.setenv('JOB_DIR', str(app_dir.parent / 'jobs'))
+        patch.setenv('RESULT_DIR', str(app_dir.parent / 'results'))
+        # Los procesos del pool de generación importan app por nombre desde sys.path
+        patch.syspath_prepend(str(app_dir))
+        import app
+        assert Path(app.__file__).parent == app_dir
+        yield app
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
@@ -0,0 +1,133 @@
+"""
+Validación de parámetros de la API: paginación de resultados, topones
+válidos de /api/generate, ETag/GET condicional y ediciones por fila.
+"""
+import gzip
+import json
+
+import pytest
+
+
+@pytest.fixture(scope='module')
+def result(app_module):
+    """Resultado generado y guardado para paginar"""
+    client = app_module.app.test_client()
+    response = client.post('/api/generate', json={'courses': ['BACH1121', 'CES1159'], 'pageSize': 5})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['success'] and body['total'] > 10
+    return body
+
+
+def test_page_of_a_stored_result(client, result):
+    response = client.get(f"/api/generate/{result['resultId']}?offset=5&limit=5")
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['offset'] == 5
+    assert body['total'] == result['total']
+    assert len(body['schedules']) == 5
+
+    first = client.get(f"/api/generate/{result['resultId']}?offset=0&limit=5").get_json()
+    assert first['schedules'] == result['schedules']
+
+
+def test_page_from_another_worker(app_module, client, result, monkeypatch):
+    # Otro worker no tiene el resultado en memoria: lo lee de RESULT_DIR
+    monkeypatch.setattr(app_module, 'result_cache',
+                        app_module.ResultCache(app_module.RESULT_CACHE_TTL, app_module.RESULT_CACHE_MAX_ENTRIES))
+    response = client.get(f"/api/generate/{result['resultId']}?offset=0&limit=5")
+    assert response.status_code == 200
+    assert response.get_json()['schedules'] == result['schedules']
+
+
+@pytest.mark.parametrize('query', ['offset=abc', 'offset=-1', 'offset=', 'limit=0', 'limit=1000', 'limit=2.5',
+                                   'format=xml'])
+def test_page_with_invalid_parameters(client, result, query):
+    response = client.get(f"/api/generate/{result['resultId']}?{query}")
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+
+
+@pytest.mark.parametrize('result_id', ['f' * 32, 'nope', '..%2Fconfig'])
+def test_page_of_an_unknown_result(client, result_id):
+    response = client.get(f'/api/generate/{result_id}')
+    assert response.status_code == 404
+
+
+@pytest.mark.parametrize('valid_topones', [[], {'x': 'a'}, {'x': {'section': 'uno'}}, {'x': {'dia': 'Lunes'}}])
+def test_generate_with_malformed_valid_topones(client, valid_topones):
+    response = client.post('/api/generate', json={'courses': ['BACH1121'], 'validTopones': valid_topones})
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+@pytest.mark.parametrize('path', ['/api/courses', '/api/course/BACH1121/structure', '/api/data/all'])
+def test_conditional_get(client, path):
+    response = client.get(path)
+    assert response.status_code == 200
+    etag, weak = response.get_etag()
+    assert etag and not weak
+    assert response.headers['Cache-Control'] == 'no-cache'
+
+    cached = client.get(path, headers={'If-None-Match': f'"{etag}"'})
+    assert cached.status_code == 304
+    assert cached.get_etag() == (etag, False)
+    assert not cached.data
+    assert 'Accept-Encoding' in cached.headers['Vary']
+
+
+def test_conditional_get_of_the_compressed_variant(client):
+    response = client.get('/api/data/all', headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert json.loads(gzip.decompress(response.data))
+    etag, _ = response.get_etag()
+    assert etag.endswith('-gzip')
+
+    cached = client.get('/api/data/all', headers={'Accept-Encoding': 'gzip', 'If-None-Match': f'"{etag}"'})
+    assert cached.status_code == 304
+    assert 'Accept-Encoding' in cached.headers['Vary']
+
+
+def test_conditional_get_with_another_version(client):
+    response = client.get('/api/courses', headers={'If-None-Match': '"0123456789abcdef"'})
+    assert response.status_code == 200
+    assert response.get_json()
+
+
+@pytest.mark.parametrize('body', [{}, {'_id': 0}, {'columna_inventada': 1}, [], 'BACH1121'])
+@pytest.mark.parametrize('method, path', [('post', '/api/data/rows'), ('patch', '/api/data/rows/0')])
+def test_row_edit_with_invalid_body(client, method, path, body):
+    response = getattr(client, method)(path, json=body)
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+
+
+@pytest.mark.parametrize('method, path', [('post', '/api/data/rows'), ('patch', '/api/data/rows/0')])
+def test_row_edit_without_json(client, method, path):
+    response = getattr(client, method)(path, data='asig_nombre=x', content_type='application/x-www-form-urlencoded')
+    assert response.status_code == 400
+
+
+def test_row_edit_of_a_missing_row(client):
+    assert client.patch('/api/data/rows/999999999', json={'asig_nombre': 'x'}).status_code == 404
+    assert client.delete('/api/data/rows/999999999').status_code == 404
+
+
+def test_row_edit_with_invalid_value(client):
+    response = client.patch('/api/data/rows/0', json={'psec_codigo': 'uno'})
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+
+
+def test_row_edit_is_applied(app_module, client):
+    version = client.get('/api/courses').get_etag()[0]
+    response = client.patch('/api/data/rows/0', json={'asig_nombre': 'Nombre editado'})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['row']['asig_nombre'] == 'Nombre editado'
+    assert body['row']['_id'] == 0
+    assert app_module.dataset.df.at[0, 'asig_nombre'] == 'Nombre editado'
+    # La edición cambia la versión de los datos: el ETag anterior ya no sirve
+    assert client.get('/api/courses', headers={'If-None-Match': f'"{version}"'}).status_code == 200
@@ -0,0 +1,183 @@
+"""
+Búsqueda de horarios contra la enumeración original.
+
+La búsqueda en profundidad, el evaluador por lotes y el pool de procesos deben
+dar los mismos horarios, en el mismo orden y con los mismos puntajes,
+conflictos y totales que recorrer todas las combinaciones con
+itertools.product, evaluarlas con is_valid_combination y ordenarlas como la
+versión original.
+"""
+import itertools
+import random
+
+import pandas as pd
+import pytest
+
+COURSES = ['BACH1121', 'CES1159', 'QUI1150', 'ICINF1104']
+DAYS = ['Lunes', 'Martes', 'Miercoles', 'Jueves', 'Viernes']
+STARTS = ['08:00', '08:30', '10:00', '10:20', '11:30', '13:00', '14:00', '15:30']
+CAMPUSES = ['Campus Alemania', 'Campus San Juan Pablo II', 'Virtual', 'Campus Chillán']
+
+GROUP_CONFIGS = {
+    'CES1159_1': {'course': 'CES1159', 'section': 1, 'groups': [0, 1]},
+    'QUI1150_3': {'course': 'QUI1150', 'section': 3, 'groups': [0, 1]}
+}
+
+
+@pytest.fixture(scope='module')
+def section_index(app_module):
+    """
+    Datos sintéticos: 4 cursos con 4 secciones de 1 o 2 grupos y bloques al
+    azar (semilla fija), con topones horarios y de traslado entre campus.
+    """
+    rng = random.Random(1121)
+    rows = []
+    for course in COURSES:
+        for section in range(1, 5):
+            for group in range(section % 2 + 1):
+                for _ in range(rng.randint(1, 3)):
+                    start = rng.choice(STARTS)
+                    end = int(start[:2]) * 60 + int(start[3:]) + rng.choice([70, 80, 120])
+                    rows.append({
+                        'asig_codigo': course,
+                        'asig_nombre': f'Curso {course}',
+                        'psec_codigo': section,
+                        'pgru_codigo': group,
+                        'sdia_descripcion': rng.choice(DAYS),
+                        'sper_hora_ini': start,
+                        'sper_hora_fin': f'{end // 60:02d}:{end % 60:02d}',
+                        'camp_campus': rng.choice(CAMPUSES)
+                    })
+    return app_module.build_section_index(pd.DataFrame(rows))
+
+
+@pytest.fixture(scope='module')
+def valid_topones(section_index):
+    """Topones válidos (completo y parcial) sobre bloques de BACH1121"""
+    blocks = [block for groups in section_index['BACH1121'].values() for blocks in groups.values() for block in blocks]
+    return {
+        f'topon{i}': {'course': 'BACH1121', 'section': block.seccion, 'dia': block.dia, 'hora_ini': block.hora_ini,
+                      'hora_fin': block.hora_fin, 'tapon_type': tapon_type}
+        for i, (block, tapon_type) in enumerate(zip(blocks[:6], ['completo', 'parcial'] * 3))
+    }
+
+
+def course_options(app_module, section_index, course, group_configs):
+    """Opciones de sección de un curso, con los grupos combinados de group_configs"""
+    combined = {}
+    for config in group_configs.values():
+        if config['course'] == course:
+            combined.setdefault(config['section'], []).append(config['groups'])
+
+    options = []
+    for section in sorted({sec['psec_codigo'] for sec in app_module.get_course_sections(section_index, course)}):
+        groups = [sec['pgru_codigo'] for sec in app_module.get_course_sections(section_index, course)
+                  if sec['psec_codigo'] == section]
+        for required in combined.get(section, [[group] for group in groups]):
+            if all(group in groups for group in required):
+                blocks = [block for group in required
+                          for block in app_module.get_section_blocks(section_index, course, section, group)]
+                name = '+'.join(map(str, required)) if section in combined else required[0]
+                options.append(({'course': course, 'section': section, 'group': name}, blocks))
+    return options
+
+
+def brute_force(app_module, section_index, courses, group_configs, valid_topones, include_conflicts, limit,
+                scoring=None):
+    """Todas las combinaciones, ordenadas como lo hacía la versión original; retorna (horarios, totales)"""
+    tiers = {'valid': [], 'valid_topon': [], 'conflict': []}
+    options = [course_options(app_module, section_index, course, group_configs) for course in courses]
+    for combination in itertools.product(*options):
+        sections_blocks = [blocks for _, blocks in combination]
+        is_valid, conflicts, topones_found = app_module.is_valid_combination(sections_blocks, valid_topones)
+        schedule = {
+            'sections': [info for info, _ in combination],
+            'blocks': [block.to_dict() for block in itertools.chain(*sections_blocks)],
+            'score': float(app_module.calculate_schedule_score(sections_blocks, scoring)),
+            'conflicts': [conflict['message'] for conflict in conflicts],
+            'conflict_types': {conflict['type'] for conflict in conflicts},
+            'valid_topones': [topon['message'] for topon in topones_found],
+            'valid_topon_types': {topon['topon_type'] for topon in topones_found}
+        }
+        tiers['conflict' if not is_valid else 'valid_topon' if topones_found else 'valid'].append(schedule)
+
+    totals = {tier: len(schedules) for tier, schedules in tiers.items()}
+    tiers['valid'].sort(key=lambda schedule: schedule['score'], reverse=True)
+    tiers['valid_topon'].sort(key=lambda schedule: schedule['score'], reverse=True)
+    tiers['conflict'].sort(key=lambda schedule: (len(schedule['conflicts']), -schedule['score']))
+    conflict_limit = min(limit, app_module.MAX_CONFLICT_SCHEDULES) if include_conflicts else 0
+    return tiers['valid'][:limit] + tiers['valid_topon'][:limit] + tiers['conflict'][:conflict_limit], totals
+
+
+def comparable(schedule):
+    """
+    Los mensajes se comparan sin orden: la búsqueda los junta por par de
+    opciones y la enumeración original por par de bloques.
+    """
+    return dict(
+        {key: schedule[key] for key in ('sections', 'blocks', 'score')},
+        conflicts=sorted(schedule['conflicts']),
+        conflict_types=sorted(schedule['conflict_types']),
+        valid_topones=sorted(schedule['valid_topones']),
+        valid_topon_types=sorted(schedule['valid_topon_types'])
+    )
+
+
+@pytest.fixture(params=['search_schedules', 'batch_search_schedules', 'parallel_search_schedules'])
+def search_path(request, app_module, monkeypatch):
+    """
+    Fuerza cada camino de generate_schedules para selecciones de cualquier
+    tamaño; retorna la lista de llamadas a la función de ese camino.
+    """
+    if request.param == 'batch_search_schedules':
+        monkeypatch.setattr(app_module, 'BATCH_MIN_COMBINATIONS', 1)
+    elif request.param == 'parallel_search_schedules':
+        monkeypatch.setattr(app_module, 'PARALLEL_MIN_COMBINATIONS', 1)
+        monkeypatch.setattr(app_module, 'GENERATE_PROCESSES', 2)
+    calls = []
+    search = getattr(app_module, request.param)
+    monkeypatch.setattr(app_module, request.param, lambda *args, **kwargs: calls.append(args) or search(*args, **kwargs))
+    return calls
+
+
+SELECTIONS = [
+    pytest.param(COURSES, {}, False, True, 500, id='all-courses'),
+    pytest.param(COURSES, {}, True, True, 500, id='valid-topones'),
+    pytest.param(COURSES, GROUP_CONFIGS, True, True, 500, id='group-configs'),
+    pytest.param(COURSES, GROUP_CONFIGS, True, True, 7, id='small-limit'),
+    pytest.param(COURSES[:3], {}, True, False, 500, id='without-conflicts'),
+    pytest.param(COURSES[1:2], GROUP_CONFIGS, False, True, 500, id='one-course')
+]
+
+
+@pytest.mark.parametrize('courses, group_configs, with_topones, include_conflicts, limit', SELECTIONS)
+def test_generate_matches_brute_force(app_module, section_index, valid_topones, search_path, courses, group_configs,
+                                      with_topones, include_conflicts, limit):
+    topones = valid_topones if with_topones else {}
+    expected, expected_totals = brute_force(app_module, section_index, courses, group_configs, topones,
+                                            include_conflicts, limit)
+    schedules, totals = app_module.generate_schedules(section_index, courses, group_configs=group_configs,
+                                                      valid_topones=topones, include_conflicts=include_conflicts,
+                                                      limit=limit)
+
+    assert search_path
+    assert totals == expected_totals
+    assert [comparable(schedule) for schedule in schedules] == [comparable(schedule) for schedule in expected]
+
+
+def test_fixture_covers_every_tier(app_module, section_index, valid_topones):
+    _, totals = brute_force(app_module, section_index, COURSES, GROUP_CONFIGS, valid_topones, True, 500)
+    assert all(totals.values()), totals
+
+
+def test_custom_scoring_matches_brute_force(app_module, section_index, valid_topones, search_path):
+    scoring = app_module.ScoringEngine({'early_start': 0, 'latest_end': 3, 'campus_changes': 20, 'preferred_window': 1},
+                                       [(480, 780)])
+    expected, expected_totals = brute_force(app_module, section_index, COURSES, GROUP_CONFIGS, valid_topones, True,
+                                            50, scoring)
+    schedules, totals = app_module.generate_schedules(section_index, COURSES, group_configs=GROUP_CONFIGS,
+                                                      valid_topones=valid_topones, limit=50, scoring=scoring)
+
+    assert search_path
+    assert totals == expected_totals
+    assert [comparable(schedule) for schedule in schedules] == [comparable(schedule) for schedule in expected]
@@ -0,0 +1,148 @@
+"""
+Diario de ediciones por fila y compactación (STORAGE_BACKEND=excel).
+
+Cada prueba trabaja sobre una copia de la aplicación en una carpeta temporal
+y corre cada "worker" como un proceso aparte, como lo hace gunicorn.
+"""
+import json
+import os
+import subprocess
+import sys
+import textwrap
+import time
+
+import pandas as pd
+
+
+def app_script(code):
+    """Programa que importa app y corre code; code imprime su resultado como JSON en la última línea"""
+    return "import sys, os, json, time\nsys.path.insert(0, '.')\nimport app\n" + textwrap.dedent(code)
+
+
+def app_env(workdir):
+    return dict(os.environ, STORAGE_BACKEND='excel', GENERATE_PROCESSES='1',
+                JOB_DIR=str(workdir.parent / 'jobs'), RESULT_DIR=str(workdir.parent / 'results'))
+
+
+def start_app(workdir, code):
+    return subprocess.Popen([sys.executable, '-c', app_script(code)], cwd=workdir, env=app_env(workdir),
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+
+
+def finish(process):
+    stdout, stderr = process.communicate(timeout=300)
+    assert process.returncode == 0, stderr
+    return json.loads(stdout.strip().splitlines()[-1])
+
+
+def run_app(workdir, code):
+    return finish(start_app(workdir, code))
+
+
+# Estado de los datos de un proceso recién iniciado
+LOAD = """
+names = {int(i): app.dataset.df.at[i, 'asig_nombre'] for i in app.dataset.df.index[:20]}
+print(json.dumps({'hash': app.dataset.data_hash, 'names': names, 'rows': len(app.dataset.df)}), flush=True)
+os._exit(0)
+"""
+
+
+def test_edits_survive_a_crash(workdir):
+    before = run_app(workdir, LOAD)
+    
+    # Se cae sin compactar (os._exit se salta el guardado de atexit): la edición solo está en el diario
+    edited = run_app(workdir, """
+    row, row_id, _ = app.apply_row_edit(0, {'asig_nombre': 'Editado antes de caer'})
+    app.apply_row_edit(None, dict(app.dataset.df.loc[1].to_dict(), asig_nombre='Fila nueva'))
+    print(json.dumps({'hash': app.dataset.data_hash, 'rows': len(app.dataset.df)}), flush=True)
+    os._exit(1 if app.dataset.df.at[0, 'asig_nombre'] != 'Editado antes de caer' else 0)
+    """)
+    
+    after = run_app(workdir, LOAD)
+    assert after['names']['0'] == 'Editado antes de caer'
+    assert after['rows'] == before['rows'] + 1 == edited['rows']
+    assert after['hash'] == edited['hash'] != before['hash']
+    assert pd.read_excel(workdir / 'consolidado.xlsx')['asig_nombre'][0] == before['names']['0']
+
+
+def wait_for(path, timeout=120):
+    deadline = time.monotonic() + timeout
+    while not path.exists():
+        assert time.monotonic() < deadline, f'{path.name} no apareció'
+        time.sleep(0.05)
+
+
+def test_compaction_writes_excel_and_keeps_the_data_hash(workdir):
+    # Un worker que edita y sigue corriendo mientras otro compacta
+    worker = start_app(workdir, """
+    app.apply_row_edit(0, {'asig_nombre': 'Compactado'})
+    open('edited', 'w').close()
+    while not os.path.exists('compacted'):
+        time.sleep(0.05)
+    print(json.dumps({'hash': app.dataset.data_hash}), flush=True)
+    os._exit(0)
+    """)
+    wait_for(workdir / 'edited')
+    compacted = run_app(workdir, """
+    app.write_consolidado()
+    print(json.dumps({'hash': app.dataset.data_hash}), flush=True)
+    os._exit(0)
+    """)
+    (workdir / 'compacted').touch()
+    running = finish(worker)
+    
+    # El diario quedó vacío y el Excel tiene la edición
+    lines = (workdir / 'consolidado.journal.jsonl').read_text(encoding='utf-8').splitlines()
+    assert len(lines) == 1 and 'base_seq' in json.loads(lines[0])
+    assert pd.read_excel(workdir / 'consolidado.xlsx')['asig_nombre'][0] == 'Compactado'
+    
+    # Todos reportan el mismo hash (mismo ETag): el que compactó, el que no recargó y uno nuevo
+    after = run_app(workdir, LOAD)
+    assert after['names']['0'] == 'Compactado'
+    assert after['hash'] == compacted['hash'] == running['hash']
+    
+    # Y sin snapshot, el Excel compactado tiene los mismos datos
+    os.remove(workdir / 'consolidado.snapshot.pkl')
+    assert run_app(workdir, LOAD)['names'] == after['names']
+
+
+def test_journal_replaced_while_another_process_appends(workdir):
+    writer = start_app(workdir, """
+    for i in range(20):
+        app.apply_row_edit(i, {'asig_nombre': f'Edición {i}'})
+        time.sleep(0.05)
+    print(json.dumps({'hash': app.dataset.data_hash}), flush=True)
+    os._exit(0)
+    """)
+    compactor = start_app(workdir, """
+    for _ in range(5):
+        app.write_consolidado()
+        time.sleep(0.15)
+    print(json.dumps({'hash': app.dataset.data_hash}), flush=True)
+    os._exit(0)
+    """)
+    written = finish(writer)
+    finish(compactor)
+    
+    after = run_app(workdir, LOAD)
+    assert after['names'] == {str(i): f'Edición {i}' for i in range(20)}
+    assert after['hash'] == written['hash']
+
+
+def test_pending_compaction_is_scheduled_on_the_first_request(workdir):
+    run_app(workdir, """
+    app.apply_row_edit(0, {'asig_nombre': 'Sin compactar'})
+    print(json.dumps({}), flush=True)
+    os._exit(0)
+    """)
+    
+    # Al importar (en el maestro de gunicorn con preload_app) no se inicia el Timer; sí con la primera petición
+    state = run_app(workdir, """
+    before = {'pending': app.journal.needs_compaction, 'timer': app.excel_writer._timer is not None}
+    app.app.test_client().get('/api/courses')
+    after = {'pending': app.journal.needs_compaction, 'timer': app.excel_writer._timer is not None}
+    print(json.dumps({'before': before, 'after': after}), flush=True)
+    os._exit(0)
+    """)
+    assert state['before'] == {'pending': True, 'timer': False}
+    assert state['after'] == {'pending': False, 'timer': True}
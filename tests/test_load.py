@@ -0,0 +1,50 @@
+"""
+Carga de consolidado.xlsx: días y horas se normalizan por columna, una vez
+por valor distinto (map_unique), y no fila por fila.
+"""
+import datetime
+import itertools
+
+import openpyxl
+import pytest
+
+DAYS = ['LUNES', ' martes', 'Miércoles', 'jueves ', 'VIERNES', 'sábado']
+STARTS = ['08:30:00', datetime.time(10, 0), '11:30', datetime.time(14, 0)]
+ENDS = ['09:50:00', datetime.time(11, 20), '12:50', datetime.time(15, 20)]
+
+
+@pytest.fixture
+def excel_path(tmp_path):
+    """Excel del formato nuevo con 300 filas y pocas grafías distintas de días y horas"""
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(['CODIGO CURSO', 'NOMBRE CURSO', 'SECCION', 'GRUPO', 'SEMESTRE', 'CAMPUS', 'DIA', 'HORA INICIO',
+                  'HORA FIN'])
+    for i, day, (start, end) in zip(range(300), itertools.cycle(DAYS), itertools.cycle(zip(STARTS, ENDS))):
+        sheet.append([f'CURSO{i % 30}', f'Curso {i % 30}', i % 5 + 1, 0, 1, 'Campus San Juan Pablo II', day, start,
+                      end])
+    path = tmp_path / 'consolidado.xlsx'
+    workbook.save(path)
+    return str(path)
+
+
+def test_load_normalizes_once_per_distinct_value(app_module, excel_path, monkeypatch):
+    calls = {}
+    map_unique = app_module.map_unique
+
+    def spy(series, func):
+        def counted(value):
+            calls[series.name] = calls.get(series.name, 0) + 1
+            return func(value)
+        return map_unique(series, counted)
+
+    monkeypatch.setattr(app_module, 'map_unique', spy)
+    df = app_module.read_consolidado(excel_path)
+
+    assert len(df) == 300
+    assert calls['sdia_descripcion'] == len(DAYS)
+    assert calls['sper_hora_ini'] <= len(STARTS)
+    assert calls['sper_hora_fin'] <= len(ENDS)
+    assert set(df['sdia_descripcion']) == {'Lunes', 'Martes', 'Miercoles', 'Jueves', 'Viernes', 'Sabado'}
+    assert set(df['sper_hora_ini']) == {'08:30', '10:00', '11:30', '14:00'}
+    assert set(df['sper_hora_fin']) == {'09:50', '11:20', '12:50', '15:20'}